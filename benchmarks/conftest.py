@@ -0,0 +1,103 @@
+import logging
+
+import numpy as np
+import polars as pl
+import pooch
+import pytest
+import scipy.io
+import scipy.sparse as sp
+
+from morb_fetch.config import Settings
+
+# Number of states of the synthetic examples
+EXAMPLE_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+@pytest.fixture(autouse=True)
+def quiet_logging():
+    """ Keep the per-call log messages out of the timings. """
+    logger = logging.getLogger("morb_fetch")
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    yield
+    logger.setLevel(level)
+
+
+@pytest.fixture(scope="session")
+def index_config(tmp_path_factory):
+    """
+    Settings pointing to a local index of 5000 synthetic examples with 50 columns,
+    the size of the MORB index, already in the cache so no server is needed.
+    """
+    cache = tmp_path_factory.mktemp("cache")
+    n = 5000
+    columns = {
+        "id": [f"synthetic{i}_n{i}m1q1" for i in range(n)],
+        "category": [f"category{i % 20}" for i in range(n)],
+        "sourceFilesize": [f"{i + 1} MB" for i in range(n)],
+        "sourceFilehash": [f"sha256:{i:064x}" for i in range(n)],
+        "zenodoLink": [""] * n,
+    }
+    for j in range(50 - len(columns)):
+        columns[f"column{j}"] = [f"value {j} of example {i}" for i in range(n)]
+
+    (cache / "data").mkdir()
+    indexfile = cache / "data" / "examples.csv"
+    pl.DataFrame(columns).write_csv(indexfile)
+
+    return Settings(
+        cache=cache,
+        indexfile="examples.csv",
+        indexfilehash="sha256:" + pooch.file_hash(str(indexfile)),
+    )
+
+
+@pytest.fixture(scope="session")
+def examples_config(tmp_path_factory):
+    """
+    Settings pointing to a local index of synthetic ABCE examples of growing size,
+    with their MAT files already in the cache so no server is needed.
+    The ids are `synthetic_n<n>m1q1` for n in `EXAMPLE_SIZES`.
+    """
+    cache = tmp_path_factory.mktemp("cache")
+    folder = cache / "data" / "synthetic"
+    folder.mkdir(parents=True)
+
+    rows = []
+    for n in EXAMPLE_SIZES:
+        id = f"synthetic_n{n}m1q1"
+        filepath = folder / f"{id}.mat"
+        scipy.io.savemat(
+            filepath,
+            {
+                "A": sp.diags([1.0, -2.0, 1.0], [-1, 0, 1], shape=(n, n), format="csc"),
+                "B": np.ones((n, 1)),
+                "C": np.ones((1, n)),
+                "E": sp.eye(n, format="csc"),
+            },
+        )
+        rows.append(
+            {
+                "id": id,
+                "category": "synthetic",
+                "sourceFilesize": f"{filepath.stat().st_size} B",
+                "sourceFilehash": "sha256:" + pooch.file_hash(str(filepath)),
+                "zenodoLink": "",
+            }
+        )
+
+    indexfile = cache / "data" / "examples.csv"
+    pl.DataFrame(rows).write_csv(indexfile)
+
+    return Settings(
+        cache=cache,
+        indexfile="examples.csv",
+        indexfilehash="sha256:" + pooch.file_hash(str(indexfile)),
+    )
+
+
+@pytest.fixture(scope="session")
+def example_files(examples_config):
+    """ The MAT file of the synthetic example with n states, for n in `EXAMPLE_SIZES`. """
+    folder = examples_config.cache / "data" / "synthetic"
+    return {n: folder / f"synthetic_n{n}m1q1.mat" for n in EXAMPLE_SIZES}
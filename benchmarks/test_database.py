@@ -0,0 +1,50 @@
+import polars as pl
+import pytest
+
+from morb_fetch.examples import Database
+
+
+@pytest.fixture(scope="module")
+def database(index_config):
+    return Database(index_config)
+
+
+def test_construction(benchmark, index_config):
+    """ Warm start: the index is memory-mapped from its binary cache. """
+    Database(index_config)
+    benchmark(Database, index_config)
+
+
+def test_construction_csv(benchmark, index_config, database):
+    """ Reference: parse the CSV file, as without the binary cache. """
+    benchmark(
+        pl.read_csv,
+        database.filepath,
+        infer_schema=False,
+        missing_utf8_is_empty_string=True,
+    )
+
+
+def test_lookup(benchmark, database):
+    ids = database.list_ids()[::50]
+    benchmark(lambda: [database.lookup(id) for id in ids])
+
+
+def test_lookup_filter(benchmark, database):
+    """ Reference: lookup by filtering the full frame, as before the id index. """
+    ids = database.list_ids()[::50]
+    benchmark(
+        lambda: [database.data.filter(pl.col("id") == id).to_dicts()[0] for id in ids]
+    )
+
+
+def test_contains(benchmark, database):
+    ids = database.list_ids()[::50]
+    benchmark(lambda: [id in database for id in ids])
+
+
+@pytest.mark.parametrize("verify", ["fast", "full"])
+def test_database_verify(benchmark, index_config, verify):
+    """ Load the index: from its binary cache, or parsing and hashing the CSV file. """
+    Database(index_config)
+    benchmark(Database, index_config, verify=verify)
@@ -0,0 +1,19 @@
+import pytest
+
+from conftest import EXAMPLE_SIZES
+from morb_fetch.examples import DataSetType
+from morb_fetch.utils import loadmat
+
+
+@pytest.mark.parametrize("n", EXAMPLE_SIZES)
+def test_loadmat(benchmark, example_files, n):
+    """ Parse the MAT file. """
+    benchmark(loadmat, example_files[n])
+
+
+@pytest.mark.parametrize("copy", [False, True], ids=["nocopy", "copy"])
+@pytest.mark.parametrize("n", EXAMPLE_SIZES)
+def test_validate(benchmark, example_files, n, copy):
+    """ Validate and classify the parsed matrices. """
+    data = loadmat(example_files[n])
+    benchmark(DataSetType.validate_python, data, context={"copy": copy})
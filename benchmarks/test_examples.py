@@ -0,0 +1,56 @@
+import pytest
+
+from conftest import EXAMPLE_SIZES
+from morb_fetch.examples import Database, DatasetCache, Example, memcache
+
+
+@pytest.fixture(scope="module")
+def database(examples_config):
+    return Database(examples_config)
+
+
+@pytest.mark.parametrize("n", EXAMPLE_SIZES)
+def test_retrieve_cold(benchmark, database, n):
+    """ Parse and validate the MAT file. """
+    example = Example(f"synthetic_n{n}m1q1", database)
+    benchmark(example.retrieve, converted=False)
+
+
+@pytest.mark.parametrize("n", EXAMPLE_SIZES)
+def test_retrieve_warm(benchmark, database, n):
+    """ Load the dataset from the converted cache. """
+    example = Example(f"synthetic_n{n}m1q1", database)
+    example.retrieve(converted=True)
+    benchmark(example.retrieve, converted=True)
+
+
+@pytest.mark.parametrize("n", EXAMPLE_SIZES)
+def test_retrieve_mmap(benchmark, database, n):
+    """ Memory-map the dataset from the converted cache. """
+    example = Example(f"synthetic_n{n}m1q1", database)
+    example.retrieve(mmap=True)
+    benchmark(example.retrieve, mmap=True)
+
+
+@pytest.mark.parametrize("n", EXAMPLE_SIZES)
+def test_retrieve_memory(benchmark, database, monkeypatch, n):
+    """ Serve the dataset from the in-process memory cache. """
+    monkeypatch.setattr(memcache, "_dataset_cache", DatasetCache(2**34))
+    example = Example(f"synthetic_n{n}m1q1", database)
+    example.retrieve()
+    benchmark(example.retrieve)
+
+
+@pytest.mark.parametrize("n", EXAMPLE_SIZES)
+def test_retrieve_lazy(benchmark, database, n):
+    """ Classify the dataset without reading any matrix. """
+    example = Example(f"synthetic_n{n}m1q1", database)
+    benchmark(example.retrieve, lazy=True)
+
+
+@pytest.mark.parametrize("verify", ["fast", "full"])
+def test_fetch_verify(benchmark, database, verify):
+    """ Check the cached data file: trusted by the manifest, or hashed. """
+    example = Example(f"synthetic_n{EXAMPLE_SIZES[-1]}m1q1", database)
+    example.fetch(progressbar=False)
+    benchmark(example.fetch, progressbar=False, verify=verify)
@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+import pytest
+
+STATEMENTS = {
+    "interpreter": "pass",
+    "package": "import morb_fetch",
+    "config": "from morb_fetch import get_config; get_config()",
+    "database": "from morb_fetch import Database",
+}
+
+
+def run(*args):
+    subprocess.run([sys.executable, *args], check=True, capture_output=True)
+
+
+@pytest.mark.parametrize("name", STATEMENTS)
+def test_import(benchmark, name):
+    """ Start a fresh interpreter and import; 'interpreter' is the baseline to subtract. """
+    benchmark.pedantic(run, args=("-c", STATEMENTS[name]), rounds=10, warmup_rounds=1)
+
+
+def test_cli_list_config(benchmark):
+    benchmark.pedantic(run, args=("-m", "morb_fetch", "--list-config"), rounds=10, warmup_rounds=1)
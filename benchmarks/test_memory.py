@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import EXAMPLE_SIZES
+from morb_fetch.examples import Database, Example
+
+pytest.importorskip("resource")
+
+# Report the peak RSS of a fresh process running Example.retrieve
+RETRIEVE = """
+import resource, sys
+from morb_fetch import Database, Example
+
+example = Example(sys.argv[1], Database())
+example.retrieve(copy=sys.argv[2] == "copy", mmap=sys.argv[2] == "mmap")
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(peak * (1 if sys.platform == "darwin" else 1024))
+"""
+
+
+def peak_rss(config, id, mode):
+    env = {
+        **os.environ,
+        "MORBFETCH_CACHE": str(config.cache),
+        "MORBFETCH_INDEXFILEHASH": config.indexfilehash,
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", RETRIEVE, id, mode],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return int(result.stdout.split()[-1])
+
+
+@pytest.mark.parametrize("n", EXAMPLE_SIZES)
+@pytest.mark.parametrize("mode", ["copy", "nocopy", "mmap"])
+def test_retrieve_peak_rss(benchmark, examples_config, n, mode):
+    """
+    Peak RSS of Example.retrieve: copy matches the validation before zero-copy,
+    mmap maps the converted cache (created beforehand) without reading it.
+    """
+    id = f"synthetic_n{n}m1q1"
+    if mode == "mmap":
+        Example(id, Database(examples_config)).retrieve(converted=True)
+    peak = benchmark.pedantic(peak_rss, args=(examples_config, id, mode), rounds=1)
+    benchmark.extra_info["peak_rss_mb"] = peak / 2**20
@@ -23,6 +23,16 @@ def tests(session: nox.Session) -> None:
     session.run("pytest", *session.posargs)
 
 
+@nox.session(default=False)
+def benchmarks(session: nox.Session) -> None:
+    """
+    Run the benchmarks. Pass pytest-benchmark options, e.g. --benchmark-autosave.
+    """
+    benchmark_deps = nox.project.dependency_groups(PROJECT, "benchmark")
+    session.install("-e.", *benchmark_deps)
+    session.run("pytest", "benchmarks", *session.posargs)
+
+
 @nox.session(reuse_venv=True, default=False)
 def docs(session: nox.Session) -> None:
     """
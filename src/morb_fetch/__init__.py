@@ -4,30 +4,79 @@ Copyright (c) 2025 MORB Developers and Contributors. All rights reserved.
 morb-fetch: Data Fetcher for MORB
 """
 
-from morb_fetch.utils import loadmat, setup_logging
+from typing import TYPE_CHECKING
+
+from morb_fetch.utils import lazy_exports, setup_logging
 
 setup_logging()
 
-from morb_fetch.config import Settings, print_config, get_config, clear_config
-from morb_fetch.examples import (
-    ABCType,
-    ABCEType,
-    ABCDEType,
-    BCKMType,
-    BCEKMType,
-    DataSetType,
-    DataSet,
-    Matrix,
-    Example,
-    Database,
-    get_database,
-)
-from morb_fetch.toolkits import (
-    ToolkitDownloader,
-    MORLABDownloader,
-    MMESSDownloader,
+# Public names are imported from their modules on first access, so that
+# importing the package does not load polars, scipy or pydantic.
+__getattr__, __dir__ = lazy_exports(
+    __name__,
+    {
+        "Settings": "morb_fetch.config",
+        "get_config": "morb_fetch.config",
+        "clear_config": "morb_fetch.config",
+        "print_config": "morb_fetch.config",
+        "DataSetType": "morb_fetch.examples",
+        "DataSet": "morb_fetch.examples",
+        "LazyDataSet": "morb_fetch.examples",
+        "Matrix": "morb_fetch.examples",
+        "ABCType": "morb_fetch.examples",
+        "ABCEType": "morb_fetch.examples",
+        "ABCDEType": "morb_fetch.examples",
+        "BCKMType": "morb_fetch.examples",
+        "BCEKMType": "morb_fetch.examples",
+        "Database": "morb_fetch.examples",
+        "PrefetchSummary": "morb_fetch.examples",
+        "IndexDiff": "morb_fetch.examples",
+        "Example": "morb_fetch.examples",
+        "ExampleCollection": "morb_fetch.examples",
+        "ToolkitDownloader": "morb_fetch.toolkits",
+        "MORLABDownloader": "morb_fetch.toolkits",
+        "MMESSDownloader": "morb_fetch.toolkits",
+        "DatasetCache": "morb_fetch.examples",
+        "diff_index": "morb_fetch.examples",
+        "get_database": "morb_fetch.examples",
+        "get_dataset_cache": "morb_fetch.examples",
+        "RetrieveStats": "morb_fetch.stats",
+        "add_stats_hook": "morb_fetch.stats",
+        "remove_stats_hook": "morb_fetch.stats",
+        "loadmat": "morb_fetch.utils",
+    },
 )
 
+if TYPE_CHECKING:
+    from morb_fetch.utils import loadmat
+    from morb_fetch.config import Settings, print_config, get_config, clear_config
+    from morb_fetch.examples import (
+        ABCType,
+        ABCEType,
+        ABCDEType,
+        BCKMType,
+        BCEKMType,
+        DataSetType,
+        DataSet,
+        LazyDataSet,
+        Matrix,
+        Example,
+        ExampleCollection,
+        Database,
+        PrefetchSummary,
+        IndexDiff,
+        DatasetCache,
+        diff_index,
+        get_database,
+        get_dataset_cache,
+    )
+    from morb_fetch.stats import RetrieveStats, add_stats_hook, remove_stats_hook
+    from morb_fetch.toolkits import (
+        ToolkitDownloader,
+        MORLABDownloader,
+        MMESSDownloader,
+    )
+
 
 __all__ = [
     "Settings",
@@ -36,6 +85,7 @@ __all__ = [
     "print_config",
     "DataSetType",
     "DataSet",
+    "LazyDataSet",
     "Matrix",
     "ABCType",
     "ABCEType",
@@ -43,10 +93,19 @@ __all__ = [
     "BCKMType",
     "BCEKMType",
     "Database",
+    "PrefetchSummary",
+    "IndexDiff",
     "Example",
+    "ExampleCollection",
     "ToolkitDownloader",
     "MORLABDownloader",
     "MMESSDownloader",
+    "DatasetCache",
+    "diff_index",
     "get_database",
+    "get_dataset_cache",
+    "RetrieveStats",
+    "add_stats_hook",
+    "remove_stats_hook",
     "loadmat",
 ]
@@ -5,7 +5,7 @@ from rich import print
 
 parser = argparse.ArgumentParser(
     prog="morb_fetch",
-    description="Configuration file management for MORB-fetch",
+    description="Configuration file and cache management for MORB-fetch",
     epilog="You may edit the configuration file once it has been created, list available ones or delete them.",
     formatter_class=argparse.RawTextHelpFormatter,
 )
@@ -51,6 +51,44 @@ parser.add_argument(
     ),
 )
 
+parser.add_argument(
+    "--cache-info",
+    action="store_true",
+    help="Print the usage of the cache",
+)
+
+parser.add_argument(
+    "--prune-cache",
+    nargs="?",
+    const="",
+    metavar="QUOTA",
+    help=(
+        "Remove cached files the index no longer refers to and evict\n"
+        "least recently used files beyond the quota.\n"
+        "  --prune-cache               → use the configured cache_quota\n"
+        "  --prune-cache 10GB          → evict down to 10 GB\n"
+    ),
+)
+
+parser.add_argument(
+    "--dry-run",
+    action="store_true",
+    help="With --prune-cache, only list what would be removed",
+)
+
+parser.add_argument(
+    "--refresh-toolkit-registry",
+    nargs="?",
+    const="",
+    metavar="SNAPSHOT",
+    help=(
+        "Request the registries of all MORLAB and M-M.E.S.S. versions from\n"
+        "Zenodo and store them as a snapshot for offline installation.\n"
+        "  --refresh-toolkit-registry              → write to the toolkit folders\n"
+        "  --refresh-toolkit-registry reg.json     → write to reg.json\n"
+    ),
+)
+
 args = parser.parse_args()
 
 if args.create_config is not None:
@@ -94,3 +132,27 @@ if args.delete_config is not None:
         yaml_path = Path(args.delete_config).expanduser().resolve()
         print(f"Deleting config: {yaml_path}")
         delete_config(yaml_path)
+
+if args.prune_cache is not None:
+    from pydantic import TypeAdapter
+    from morb_fetch.cache import CacheManager
+    from morb_fetch._types import HumanFileSize
+
+    quota = None
+    if args.prune_cache:
+        quota = TypeAdapter(HumanFileSize).validate_python(args.prune_cache)
+    removed = CacheManager().prune(quota=quota, dry_run=args.dry_run)
+    size = sum(entry.size for entry in removed) / 10**6
+    print(f"{'Would remove' if args.dry_run else 'Removed'} {len(removed)} entries ({size:.1f} MB)")
+
+if args.cache_info:
+    from morb_fetch.cache import print_cache
+
+    print_cache()
+
+if args.refresh_toolkit_registry is not None:
+    from morb_fetch.toolkits.toolkit import refresh_snapshot
+
+    path = args.refresh_toolkit_registry
+    for snapshot in refresh_snapshot(Path(path).expanduser().resolve() if path else None):
+        print(f"Refreshed toolkit registry snapshot: {snapshot}")
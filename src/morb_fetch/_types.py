@@ -1,4 +1,4 @@
-from typing import Annotated
+from typing import Annotated, Literal
 from typing_extensions import Doc
 from pydantic import StringConstraints
 
@@ -42,3 +42,33 @@ DOIstr = Annotated[
     )
 ]
 """ DOIstr: A string starting with 'doi:' followed by record id. """
+
+VerifyMode = Annotated[
+    Literal["fast", "full"],
+    Doc(
+        "'fast' trusts cached files whose size and modification time match their last verification, 'full' hashes them every time."
+    ),
+]
+""" VerifyMode: 'fast' to trust cached files verified before, 'full' to hash them on every use. """
+
+SparseFormat = Annotated[
+    Literal["csr", "csc"],
+    Doc("The storage format of sparse matrices, 'csr' for row-wise or 'csc' for column-wise compressed."),
+]
+""" SparseFormat: 'csr' or 'csc'. """
+
+IndexDtype = Annotated[
+    Literal["int32", "int64"],
+    Doc(
+        "The integer type of the index arrays of sparse matrices. 'int32' halves their size and is widened to 'int64' where it cannot hold the indices."
+    ),
+]
+""" IndexDtype: 'int32' or 'int64'. """
+
+DtypePolicy = Annotated[
+    Literal["float64", "float32", "keep"],
+    Doc(
+        "The precision of matrices: 'float64' widens them to float64 or complex128, 'float32' narrows them to float32 or complex64, 'keep' keeps the dtype of the source file."
+    ),
+]
+""" DtypePolicy: 'float64', 'float32' or 'keep'. """
@@ -0,0 +1,284 @@
+"""
+Cache management: Inspect the disk cache, enforce a quota and remove stale files
+"""
+
+import shutil
+import logging
+from pathlib import Path
+from typing import Iterable, Literal, Optional
+
+import pooch
+from pydantic import BaseModel
+
+from morb_fetch._types import HumanFileSize
+from morb_fetch.examples.database import Database
+from morb_fetch.locking import LOCK_SUFFIX, FileLock, lock_path
+from morb_fetch.utils import parse_human_size
+
+logger = logging.getLogger("morb_fetch")
+
+
+class CacheEntry(BaseModel):
+    """
+    A file or folder in the cache.
+
+    Attributes:
+        path (Path): The path of the entry.
+        kind (str): 'index', 'example', 'link', 'converted', 'partial' or 'toolkit'.
+            Example files in the content store are 'example', the `<category>/<id>.mat` paths linking to them 'link'.
+        size (int): The size in bytes, 0 for links.
+        atime (float): The last access (or modification, if later) time.
+        orphan (bool): True if the current index no longer refers to the entry.
+        links (list[Path]): The paths linking to a stored example file, removed along with it.
+    """
+
+    path: Path
+    kind: Literal["index", "example", "link", "converted", "partial", "toolkit"]
+    size: int
+    atime: float
+    orphan: bool = False
+    links: list[Path] = []
+
+
+def _is_partial(path: Path) -> bool:
+    """
+    Check whether `path` is an unfinished download or conversion, e.g. `<name>.part` or `<name>.part.0`.
+    """
+    return ".part" in path.suffixes
+
+
+def _entry(path: Path, kind: str, orphan: bool = False) -> CacheEntry:
+    """
+    Stat a file, or all files of a folder, into a cache entry.
+    """
+    files = [path] if path.is_file() else [p for p in path.rglob("*") if p.is_file()]
+    stats = [f.stat() for f in files]
+    return CacheEntry(
+        path=path,
+        kind=kind,
+        size=sum(stat.st_size for stat in stats),
+        atime=max((max(stat.st_atime, stat.st_mtime) for stat in stats), default=0.0),
+        orphan=orphan,
+    )
+
+
+class CacheManager:
+    """
+    Manage the disk cache of a database: the examples index, the content
+    store of example files and their links, converted datasets and toolkit archives.
+
+    Args:
+        database (Database, optional): The database whose cache to manage. Defaults to the global database.
+    """
+
+    def __init__(self, database: Optional[Database] = None):
+        if database is None:
+            from morb_fetch.examples.database import get_database
+
+            database = get_database()
+        self.database = database
+
+    def entries(self, verify: bool = False) -> list[CacheEntry]:
+        """
+        List the entries of the cache.
+
+        Example files in the content store and converted datasets are orphans
+        if no example of the index has their hash. Links are orphans if their id
+        is no longer in the index, is in another category or has other content.
+        Files cached before the content store are listed as examples, orphaned
+        like links; with `verify`, also if their hash does not match `sourceFilehash`.
+
+        Args:
+            verify (bool, optional): Hash example files to find corrupt or outdated ones. Defaults to False.
+
+        Returns:
+            list[CacheEntry]: The entries of the cache.
+        """
+        database = self.database
+        cache_dir = database.cache_dir
+        data = database.data
+        categories = dict(zip(data["id"].to_list(), data["category"].to_list()))
+        hashes = dict(zip(data["id"].to_list(), data["sourceFilehash"].to_list()))
+        digests = {filehash.split(":")[-1]: filehash for filehash in hashes.values()}
+
+        entries = []
+        blobs = {}
+        store = database.store
+        if store.root.exists():
+            for blob in sorted(store.root.iterdir()):
+                if blob.name.endswith(LOCK_SUFFIX):
+                    continue
+                if _is_partial(blob):
+                    entries.append(_entry(blob, "partial"))
+                    continue
+                orphan = blob.name not in digests
+                if verify and not orphan:
+                    orphan = not pooch.hashes.hash_matches(str(blob), digests[blob.name])
+                entry = _entry(blob, "example", orphan=orphan)
+                stat = blob.stat()
+                blobs[stat.st_dev, stat.st_ino] = entry
+                entries.append(entry)
+
+        for path in sorted(cache_dir.iterdir()):
+            if path.name.endswith(LOCK_SUFFIX) or path == store.root:
+                continue
+            if path == database.converted.root:
+                for converted in sorted(path.iterdir()):
+                    if converted.name.endswith(LOCK_SUFFIX):
+                        continue
+                    if _is_partial(converted):
+                        entries.append(_entry(converted, "partial"))
+                        continue
+                    digest = converted.name.split(".")[0]
+                    entries.append(_entry(converted, "converted", orphan=digest not in digests))
+            elif path.is_file():
+                entries.append(_entry(path, "index"))
+            else:
+                for file in sorted(p for p in path.rglob("*") if p.is_file()):
+                    if file.name.endswith(LOCK_SUFFIX):
+                        continue
+                    if _is_partial(file):
+                        entries.append(_entry(file, "partial"))
+                        continue
+                    id = file.stem
+                    orphan = categories.get(id) != path.name
+                    stat = file.stat()
+                    blob = blobs.get((stat.st_dev, stat.st_ino))
+                    if blob is not None:
+                        blob.links.append(file)
+                        entries.append(
+                            CacheEntry(
+                                path=file,
+                                kind="link",
+                                size=0,
+                                atime=blob.atime,
+                                orphan=orphan
+                                or hashes[id].split(":")[-1] != blob.path.name,
+                            )
+                        )
+                        continue
+                    if verify and not orphan:
+                        orphan = not pooch.hashes.hash_matches(str(file), hashes[id])
+                    entries.append(_entry(file, "example", orphan=orphan))
+
+        config = database.config
+        for folder in {config.mmess_path, config.morlab_path}:
+            if folder.exists():
+                entries.extend(_entry(zip, "toolkit") for zip in sorted(folder.glob("*.zip")))
+
+        return entries
+
+    def usage(self) -> int:
+        """
+        The total size of the cache in bytes.
+        """
+        return sum(entry.size for entry in self.entries())
+
+    def _remove(self, entry: CacheEntry, dry_run: bool) -> bool:
+        """
+        Remove an entry and its links while holding its lock.
+
+        Returns:
+            bool: False if the entry is locked, e.g. by a running download, and was kept.
+        """
+        lock = FileLock(lock_path(entry.path))
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            logger.info(
+                f"{'Would remove' if dry_run else 'Removing'} {entry.kind} {entry.path} ({entry.size} B)"
+            )
+            if dry_run:
+                return True
+            if entry.path.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                entry.path.unlink(missing_ok=True)
+            for link in entry.links:
+                link.unlink(missing_ok=True)
+        finally:
+            lock.release()
+        return True
+
+    def prune(
+        self,
+        quota: Optional[HumanFileSize] = None,
+        orphans: bool = True,
+        verify: bool = False,
+        keep: Iterable[Path] = (),
+        dry_run: bool = False,
+    ) -> list[CacheEntry]:
+        """
+        Remove orphans and evict least recently used entries until the cache fits the quota.
+        The examples index in use and entries locked by a running download or conversion are never removed;
+        every entry is removed while holding its lock, so no other process can use it meanwhile.
+
+        Args:
+            quota (HumanFileSize, optional): The size limit. Defaults to `Settings.cache_quota`.
+            orphans (bool, optional): Remove entries the current index no longer refers to. Defaults to True.
+            verify (bool, optional): Hash example files to find outdated ones. Defaults to False.
+            keep (Iterable[Path], optional): Paths that must not be removed.
+            dry_run (bool, optional): Only report what would be removed. Defaults to False.
+
+        Returns:
+            list[CacheEntry]: The removed entries.
+        """
+        if quota is None:
+            quota = self.database.config.cache_quota
+        keep = {Path(path) for path in keep}
+
+        entries = self.entries(verify=verify)
+        removable = [
+            entry
+            for entry in entries
+            if entry.kind != "index"
+            and entry.path not in keep
+            and not keep.intersection(entry.links)
+        ]
+        removed = [
+            entry for entry in removable if orphans and entry.orphan and self._remove(entry, dry_run)
+        ]
+
+        if quota is not None:
+            limit = parse_human_size(quota)
+            usage = sum(entry.size for entry in entries) - sum(entry.size for entry in removed)
+            for entry in sorted(removable, key=lambda entry: entry.atime):
+                if usage <= limit:
+                    break
+                if entry.kind == "link" or (orphans and entry.orphan):
+                    continue
+                if self._remove(entry, dry_run):
+                    removed.append(entry)
+                    usage -= entry.size
+
+        if not dry_run:
+            self.database.manifest.discard(
+                path for entry in removed for path in [entry.path, *entry.links]
+                if path.is_relative_to(self.database.cache_dir)
+            )
+
+        return removed
+
+
+def print_cache(manager: Optional[CacheManager] = None) -> None:
+    """
+    Print the usage of the cache per kind of entry.
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    manager = manager or CacheManager()
+    entries = manager.entries()
+    table = Table(title=f"morb_fetch cache: {manager.database.cache_dir}", title_justify="left")
+    table.add_column("kind", style="magenta")
+    table.add_column("entries", justify="right")
+    table.add_column("orphans", justify="right")
+    table.add_column("size", justify="right", style="deep_sky_blue1")
+    for kind in ("index", "example", "link", "converted", "partial", "toolkit"):
+        selected = [entry for entry in entries if entry.kind == kind]
+        size = sum(entry.size for entry in selected)
+        orphans = sum(entry.orphan for entry in selected)
+        table.add_row(kind, str(len(selected)), str(orphans), f"{size / 10**6:.1f} MB")
+    quota = manager.database.config.cache_quota
+    table.caption = f"total {sum(e.size for e in entries) / 10**6:.1f} MB, quota {quota}"
+    Console().print(table)
@@ -6,7 +6,7 @@ from rich import print
 from typing import Optional
 from pathlib import Path
 from platformdirs import user_config_path, user_cache_path
-from pydantic import AnyHttpUrl, TypeAdapter
+from pydantic import AnyHttpUrl, PositiveInt, TypeAdapter
 from pydantic_settings import (
     BaseSettings,
     SettingsConfigDict,
@@ -14,7 +14,13 @@ from pydantic_settings import (
     YamlConfigSettingsSource,
 )
 
-from morb_fetch._types import SHA256Hash, CSVFilename, HumanFileSize, ConfigFilename
+from morb_fetch._types import (
+    SHA256Hash,
+    CSVFilename,
+    HumanFileSize,
+    ConfigFilename,
+    VerifyMode,
+)
 
 logger = logging.getLogger("morb_fetch")
 logger.setLevel(logging.INFO)
@@ -35,6 +41,12 @@ DEFAULT_SERVER_URL = "https://modelreduction.org/morb-data/"
 DEFAULT_INDEXFILE = "examples.csv"
 DEFAULT_INDEXFILEHASH = "sha256:39a07469c4b4952d66969288608cd1cccc3d86966456d7579b9dcf4b2383a54a"
 DEFAULT_MAX_FILESIZE = None
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_CONVERTED_CACHE = False
+DEFAULT_CONVERTED_COMPRESSION = False
+DEFAULT_MEMORY_CACHE = None
+DEFAULT_CACHE_QUOTA = None
+DEFAULT_VERIFY = "fast"
 DEFAULT_CACHE_PATH = user_cache_path(
     appname="morb", appauthor="morb-users", ensure_exists=True
 )
@@ -50,14 +62,26 @@ class Settings(BaseSettings):
         indexfile (CSVFilename): The filename of the index file.
         indexfilehash (SHA256Hash): The SHA256 hash of the index file.
         max_filesize (Optional[HumanFileSize]): The maximum file size allowed.
+        max_connections (int): The maximum number of pooled connections and concurrent downloads.
         cache (Path): The path to the cache directory.
+        cache_quota (Optional[HumanFileSize]): The maximum size of the cache directory.
+        verify (VerifyMode): 'fast' to trust cached files verified before, 'full' to hash them on every use.
+        converted_cache (bool): Keep validated datasets as native numpy arrays for fast loading.
+        converted_compression (bool): Compress the arrays of newly converted datasets.
+        memory_cache (Optional[HumanFileSize]): The memory budget for datasets shared between examples in a process.
     """
 
     serverurl: AnyHttpUrl = AnyHttpUrl(DEFAULT_SERVER_URL)
     indexfile: CSVFilename = DEFAULT_INDEXFILE
     indexfilehash: SHA256Hash = DEFAULT_INDEXFILEHASH
     max_filesize: Optional[HumanFileSize] = DEFAULT_MAX_FILESIZE
+    max_connections: PositiveInt = DEFAULT_MAX_CONNECTIONS
     cache: Path = DEFAULT_CACHE_PATH
+    cache_quota: Optional[HumanFileSize] = DEFAULT_CACHE_QUOTA
+    verify: VerifyMode = DEFAULT_VERIFY
+    converted_cache: bool = DEFAULT_CONVERTED_CACHE
+    converted_compression: bool = DEFAULT_CONVERTED_COMPRESSION
+    memory_cache: Optional[HumanFileSize] = DEFAULT_MEMORY_CACHE
     mmess_path: Path = DEFAULT_MMESS_PATH
     morlab_path: Path = DEFAULT_MORLAB_PATH
 
@@ -176,10 +200,22 @@ def create_config(yaml_path: Path):
         f'serverurl: "{DEFAULT_SERVER_URL}"\n'
         f'indexfile: "{DEFAULT_INDEXFILE}"\n'
         f'indexfilehash: "{DEFAULT_INDEXFILEHASH}"\n'
-        '# Restrict downloads to file size\n'
-        f'max_filesize: "{DEFAULT_MAX_FILESIZE}"\n'
+        '# Restrict downloads to file size, null for no limit\n'
+        "max_filesize: null\n"
+        "# Maximum number of concurrent connections\n"
+        f"max_connections: {DEFAULT_MAX_CONNECTIONS}\n"
         "# Custom Cache location\n"
         f'cache: "{str(DEFAULT_CACHE_PATH)}"\n'
+        "# Restrict cache to size, null for no limit\n"
+        "cache_quota: null\n"
+        "# Hash cached files on every use (full) or only when they changed (fast)\n"
+        f'verify: "{DEFAULT_VERIFY}"\n'
+        "# Keep converted datasets for fast loading\n"
+        f"converted_cache: {str(DEFAULT_CONVERTED_CACHE).lower()}\n"
+        "# Compress converted datasets on disk\n"
+        f"converted_compression: {str(DEFAULT_CONVERTED_COMPRESSION).lower()}\n"
+        "# Memory budget for loaded datasets shared in a process, null to disable\n"
+        "memory_cache: null\n"
         "# Custom MESS location\n"
         f'mmess_path: "{str(DEFAULT_MMESS_PATH)}"\n'
         "# Custom MORLAB location\n"
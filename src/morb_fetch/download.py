@@ -0,0 +1,404 @@
+"""
+Download engine: A shared, capped pool of HTTP connections for examples and toolkits
+"""
+
+import os
+import sys
+import glob
+import hashlib
+import asyncio
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+import pooch
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm.auto import tqdm
+
+from morb_fetch.config import get_config
+from morb_fetch.locking import FileLock, lock_path
+from morb_fetch.stats import RetrieveStats, timed
+
+logger = logging.getLogger("morb_fetch")
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Singleton pattern for global access, one session per connection limit
+_sessions: dict[int, requests.Session] = {}
+_session_lock = threading.Lock()
+_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[int, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_session(max_connections: Optional[int] = None) -> requests.Session:
+    """
+    Get the global HTTP session.
+    Connections are kept alive and reused, at most `max_connections` per host;
+    further requests wait for a pooled connection to be released.
+
+    Args:
+        max_connections (int, optional): The size of the connection pool. Defaults to `Settings.max_connections`.
+
+    Returns:
+        requests.Session: The global HTTP session with this connection limit.
+    """
+    if max_connections is None:
+        max_connections = get_config().max_connections
+    with _session_lock:
+        session = _sessions.get(max_connections)
+        if session is None:
+            # Block when the pool is exhausted, so that max_connections is a hard cap
+            adapter = HTTPAdapter(
+                pool_connections=max_connections, pool_maxsize=max_connections, pool_block=True
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[max_connections] = session
+
+    return session
+
+
+def close_session():
+    """
+    Close the global HTTP sessions and all pooled connections.
+    """
+    with _session_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _progress(progressbar: Union[bool, Any], total: Optional[int] = None):
+    """
+    Create the progress bar of a download, or None if disabled.
+    """
+    if progressbar is True:
+        return tqdm(
+            total=total,
+            ncols=79,
+            ascii=bool(sys.platform == "win32"),
+            unit="B",
+            unit_scale=True,
+            leave=True,
+        )
+    elif progressbar:
+        progressbar.total = total
+        return progressbar
+    return None
+
+
+def _download_range(
+    url: str,
+    segment: Path,
+    start: int = 0,
+    end: Optional[int] = None,
+    progress=None,
+    hasher=None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    timeout: float = DEFAULT_TIMEOUT,
+    session: Optional[requests.Session] = None,
+):
+    """
+    Download the bytes `start` to `end` (inclusive, None for the end of file) of `url` into `segment`.
+
+    Bytes already in `segment` from an interrupted download are kept and
+    only the remainder is requested with an HTTP Range request. A `hasher`
+    (hashlib object) is updated with the whole segment, kept bytes included.
+    """
+    offset = segment.stat().st_size if segment.exists() else 0
+    if end is not None and offset >= end - start + 1:
+        return
+
+    headers = {}
+    if start + offset > 0 or end is not None:
+        headers["Range"] = f"bytes={start + offset}-{'' if end is None else end}"
+
+    with (session or get_session()).get(
+        url, headers=headers, stream=True, timeout=timeout
+    ) as response:
+        if response.status_code == 416 and end is None:
+            # Nothing left to download
+            if hasher is not None:
+                _hash_file(segment, hasher)
+            return
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            mode = "ab"
+            if hasher is not None and offset:
+                _hash_file(segment, hasher)
+        elif start == 0 and end is None:
+            # Server ignored the Range request, start from byte zero
+            mode, offset = "wb", 0
+        else:
+            raise ValueError(f"Server does not support byte ranges for {url}.")
+
+        if progress is not None:
+            if progress.total is None and "content-length" in response.headers:
+                progress.total = offset + int(response.headers["content-length"])
+            progress.update(offset)
+
+        with open(segment, mode) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    if progress is not None:
+                        progress.update(len(chunk))
+
+
+def _download(
+    url: str,
+    part: Path,
+    progressbar: Union[bool, Any] = False,
+    parts: int = 1,
+    hasher=None,
+    session: Optional[requests.Session] = None,
+):
+    """
+    Download `url` into the partial file `part`, resuming earlier attempts.
+
+    With `parts > 1` and a server accepting byte ranges, the file is split
+    into `parts` ranges downloaded in parallel into resumable segment files,
+    which are joined into `part` at the end.
+
+    A `hasher` (hashlib object) is updated with the content as it streams in,
+    or, for parallel ranges, while the segments are joined, so the file is
+    never read back just to hash it.
+    """
+    session = session or get_session()
+    size = 0
+    if parts > 1:
+        response = session.head(url, allow_redirects=True, timeout=DEFAULT_TIMEOUT)
+        response.raise_for_status()
+        if response.headers.get("accept-ranges") == "bytes":
+            size = int(response.headers.get("content-length", 0))
+
+    progress = _progress(progressbar, total=size or None)
+    try:
+        if size < parts:
+            _download_range(url, part, progress=progress, hasher=hasher, session=session)
+            return
+
+        bounds = [size * i // parts for i in range(parts + 1)]
+        segments = [part.with_name(f"{part.name}.{i}") for i in range(parts)]
+        with ThreadPoolExecutor(max_workers=parts) as executor:
+            futures = [
+                executor.submit(
+                    _download_range, url, segment, start, stop - 1, progress, session=session
+                )
+                for segment, start, stop in zip(segments, bounds[:-1], bounds[1:])
+            ]
+            for future in futures:
+                future.result()
+
+        with open(part, "wb") as f:
+            for segment in segments:
+                with open(segment, "rb") as s:
+                    while block := s.read(DEFAULT_CHUNK_SIZE):
+                        f.write(block)
+                        if hasher is not None:
+                            hasher.update(block)
+        for segment in segments:
+            segment.unlink()
+    finally:
+        if progress is not None:
+            progress.close()
+
+
+def _hasher(known_hash: Optional[str]):
+    """
+    Create a hashlib object for the algorithm of `known_hash`, e.g. 'sha256:...',
+    or None if there is no hash or hashlib lacks the algorithm.
+    """
+    if known_hash is None:
+        return None
+    algorithm = known_hash.split(":")[0].lower() if ":" in known_hash else "sha256"
+    if algorithm not in hashlib.algorithms_available:
+        return None
+    return hashlib.new(algorithm)
+
+
+def _hash_file(filepath: Path, hasher):
+    """
+    Update `hasher` with the content of a file.
+    """
+    with open(filepath, "rb") as f:
+        while block := f.read(DEFAULT_CHUNK_SIZE):
+            hasher.update(block)
+
+
+def _check_digest(hasher, known_hash: str, fname: str):
+    """
+    Compare the digest of a streamed download with `known_hash`.
+
+    Raises:
+        ValueError: If the digest does not match.
+    """
+    expected = known_hash.split(":")[-1].lower()
+    digest = hasher.hexdigest()
+    if digest != expected:
+        raise ValueError(
+            f"{hasher.name.upper()} hash of downloaded file ({fname}) does not match the known hash:"
+            f" expected {expected} but got {digest}. The file may have been corrupted or"
+            " the known hash may be outdated."
+        )
+
+
+def retrieve(
+    url: str,
+    known_hash: Optional[str],
+    path: Path,
+    fname: str,
+    progressbar: Union[bool, Any] = False,
+    parts: int = 1,
+    stats: Optional[RetrieveStats] = None,
+    max_connections: Optional[int] = None,
+) -> Path:
+    """
+    Download a file into `path / fname` unless it exists, and verify its hash.
+
+    HTTP(S) downloads go to `fname.part` first, so that an interrupted
+    download resumes from where it stopped instead of from byte zero.
+    The hash is computed while the bytes stream in, and the file is only
+    moved into place once it matches.
+
+    Processes and threads sharing the cache take the lock `fname.lock`, so
+    exactly one of them downloads the file while the others wait for it.
+
+    Args:
+        url (str): The URL of the file.
+        known_hash (str, optional): The expected hash, e.g. 'sha256:...'.
+        path (Path): The directory to store the file in.
+        fname (str): The name of the local file.
+        progressbar (bool, optional): Show a download progress bar. Defaults to False.
+        parts (int, optional): Number of byte ranges to download in parallel. Defaults to 1.
+        stats (RetrieveStats, optional): Statistics to add the downloaded bytes, download and hash time to.
+        max_connections (int, optional): The size of the connection pool. Defaults to `Settings.max_connections`.
+
+    Returns:
+        Path: The path to the local file.
+
+    Raises:
+        ValueError: If the hash of the downloaded file does not match `known_hash`.
+    """
+    path = Path(path)
+    filepath = path / fname
+    if filepath.exists():
+        return filepath
+
+    path.mkdir(parents=True, exist_ok=True)
+    with FileLock(lock_path(filepath)):
+        if filepath.exists():
+            logger.info(f"{filepath} was downloaded by another process")
+            return filepath
+        return _retrieve(url, known_hash, path, fname, progressbar, parts, stats, max_connections)
+
+
+def _retrieve(
+    url: str,
+    known_hash: Optional[str],
+    path: Path,
+    fname: str,
+    progressbar: Union[bool, Any] = False,
+    parts: int = 1,
+    stats: Optional[RetrieveStats] = None,
+    max_connections: Optional[int] = None,
+) -> Path:
+    """
+    Download a file into `path / fname` while holding its lock.
+    """
+    filepath = path / fname
+    if not url.startswith(("http://", "https://")):
+        with timed(stats, "download_seconds"):
+            filepath = Path(
+                pooch.retrieve(
+                    url=url,
+                    known_hash=known_hash,
+                    path=path,
+                    fname=fname,
+                    downloader=pooch.downloaders.choose_downloader(url, progressbar=progressbar),
+                )
+            )
+        if stats is not None:
+            stats.download_bytes += filepath.stat().st_size
+        return filepath
+
+    part = path / f"{fname}.part"
+    resumed = sum(p.stat().st_size for p in path.glob(f"{glob.escape(part.name)}*"))
+    hasher = _hasher(known_hash)
+    with timed(stats, "download_seconds"):
+        _download(
+            url, part, progressbar=progressbar, parts=parts, hasher=hasher,
+            session=get_session(max_connections),
+        )
+    if stats is not None:
+        stats.download_bytes += part.stat().st_size - resumed
+
+    try:
+        with timed(stats, "hash_seconds"):
+            if hasher is None:
+                pooch.hashes.hash_matches(str(part), known_hash, strict=True, source=fname)
+            else:
+                _check_digest(hasher, known_hash, fname)
+    except ValueError:
+        part.unlink()
+        raise
+    os.replace(part, filepath)
+    return filepath
+
+
+def _get_limiter(max_connections: Optional[int] = None) -> asyncio.Semaphore:
+    """
+    Get the semaphore capping concurrent downloads in the running event loop at `max_connections`.
+    """
+    if max_connections is None:
+        max_connections = get_config().max_connections
+    limiters = _limiters.setdefault(asyncio.get_running_loop(), {})
+    limiter = limiters.get(max_connections)
+    if limiter is None:
+        limiter = asyncio.Semaphore(max_connections)
+        limiters[max_connections] = limiter
+    return limiter
+
+
+async def run_limited(func: Callable, *args, max_connections: Optional[int] = None, **kwargs):
+    """
+    Await a blocking download function, with at most `max_connections` running at once.
+
+    The blocking network I/O is moved off the event loop, so that the loop
+    can overlap many downloads sharing the pooled connections.
+
+    Args:
+        func (Callable): The blocking function, called with `*args` and `**kwargs`.
+        max_connections (int, optional): The limit of concurrent calls. Defaults to `Settings.max_connections`.
+    """
+    async with _get_limiter(max_connections):
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
+async def aretrieve(
+    url: str,
+    known_hash: Optional[str],
+    path: Path,
+    fname: str,
+    progressbar: Union[bool, Any] = False,
+    parts: int = 1,
+    stats: Optional[RetrieveStats] = None,
+    max_connections: Optional[int] = None,
+) -> Path:
+    """
+    Asynchronous version of `retrieve`.
+    """
+    return await run_limited(
+        retrieve, url, known_hash, path, fname, progressbar, parts, stats, max_connections,
+        max_connections=max_connections,
+    )
@@ -1,19 +1,58 @@
-from morb_fetch.examples.datasets import (
-    ABCType,
-    ABCEType,
-    ABCDEType,
-    BCKMType,
-    BCEKMType,
-    DataSetType,
-    DataSet,
-    Matrix,
+from typing import TYPE_CHECKING
+
+from morb_fetch.utils import lazy_exports
+
+__getattr__, __dir__ = lazy_exports(
+    __name__,
+    {
+        "DataSetType": "morb_fetch.examples.datasets",
+        "DataSet": "morb_fetch.examples.datasets",
+        "LazyDataSet": "morb_fetch.examples.datasets",
+        "Matrix": "morb_fetch.examples.datasets",
+        "ABCType": "morb_fetch.examples.datasets",
+        "ABCEType": "morb_fetch.examples.datasets",
+        "ABCDEType": "morb_fetch.examples.datasets",
+        "BCKMType": "morb_fetch.examples.datasets",
+        "BCEKMType": "morb_fetch.examples.datasets",
+        "Database": "morb_fetch.examples.database",
+        "PrefetchSummary": "morb_fetch.examples.database",
+        "IndexDiff": "morb_fetch.examples.database",
+        "Example": "morb_fetch.examples.example",
+        "ExampleCollection": "morb_fetch.examples.collection",
+        "DatasetCache": "morb_fetch.examples.memcache",
+        "diff_index": "morb_fetch.examples.database",
+        "get_database": "morb_fetch.examples.database",
+        "get_dataset_cache": "morb_fetch.examples.memcache",
+    },
 )
-from morb_fetch.examples.database import Database,get_database
-from morb_fetch.examples.example import Example
+
+if TYPE_CHECKING:
+    from morb_fetch.examples.datasets import (
+        ABCType,
+        ABCEType,
+        ABCDEType,
+        BCKMType,
+        BCEKMType,
+        DataSetType,
+        DataSet,
+        LazyDataSet,
+        Matrix,
+    )
+    from morb_fetch.examples.database import (
+        Database,
+        IndexDiff,
+        PrefetchSummary,
+        diff_index,
+        get_database,
+    )
+    from morb_fetch.examples.collection import ExampleCollection
+    from morb_fetch.examples.example import Example
+    from morb_fetch.examples.memcache import DatasetCache, get_dataset_cache
 
 __all__ = [
     "DataSetType",
     "DataSet",
+    "LazyDataSet",
     "Matrix",
     "ABCType",
     "ABCEType",
@@ -21,6 +60,12 @@ __all__ = [
     "BCKMType",
     "BCEKMType",
     "Database",
+    "PrefetchSummary",
+    "IndexDiff",
     "Example",
-    "get_database"
+    "ExampleCollection",
+    "DatasetCache",
+    "diff_index",
+    "get_database",
+    "get_dataset_cache",
 ]
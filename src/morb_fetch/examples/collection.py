@@ -0,0 +1,220 @@
+"""
+Example collections: Load many examples in a pipeline of downloads, parsing and validation
+"""
+
+import time
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from morb_fetch.examples.database import Database, get_database
+from morb_fetch.examples.example import Example
+from morb_fetch.stats import RetrieveStats
+from morb_fetch.utils import loadmat
+from morb_fetch._types import DtypePolicy, IndexDtype, SparseFormat
+
+logger = logging.getLogger("morb_fetch")
+
+
+def _parse(filepath: Path) -> tuple[dict, float]:
+    """
+    Parse a MAT file in a worker process, returning its variables and the time spent.
+    """
+    start = time.perf_counter()
+    data = loadmat(filepath)
+    return data, time.perf_counter() - start
+
+
+class ExampleCollection:
+    """
+    A selection of examples from the database, loaded as a stream.
+
+    `ExampleCollection.load` runs the stages of `Example.retrieve` for many
+    examples at once: data files are downloaded in a thread pool, parsed in a
+    process pool and validated in the consuming thread, and every example is
+    yielded as soon as it is ready. At most `max_in_flight` examples are
+    loaded ahead of the consumer, which bounds the memory held in the pipeline.
+
+    Args:
+        ids (Iterable[str]): The example identifiers.
+        database (Database, optional): The database of the examples. Defaults to the global database.
+
+    Example:
+        >>> collection = ExampleCollection.from_query(category="thermal", max_size="100 MB")
+        >>> for example in collection.load(dtype="float32"):
+        ...     train(example["A"], example["B"])
+    """
+
+    def __init__(self, ids: Iterable[str], database: Optional[Database] = None):
+        self.database = database or get_database()
+        self.ids = list(dict.fromkeys(ids))
+
+    @classmethod
+    def from_query(cls, database: Optional[Database] = None, **filters) -> "ExampleCollection":
+        """
+        Select the examples matching a query of the database, see `Database.query`.
+
+        Args:
+            database (Database, optional): The database to query. Defaults to the global database.
+            **filters: The filters of `Database.query`, e.g. `category="thermal"`.
+
+        Returns:
+            ExampleCollection: The selected examples, in the order of the index.
+        """
+        database = database or get_database()
+        ids = database.query(**filters).select("id").collect()["id"].to_list()
+        return cls(ids, database)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[Example]:
+        """
+        The examples with their metadata, without loading their data.
+        """
+        for id in self.ids:
+            yield Example(self.database.lookup(id), self.database)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({len(self.ids)} examples)"
+
+    def load(
+        self,
+        download_workers: int = 4,
+        parse_workers: Optional[int] = None,
+        max_in_flight: int = 8,
+        ordered: bool = False,
+        skip_errors: bool = False,
+        copy: bool = False,
+        converted: Optional[bool] = None,
+        sparse_format: Optional[SparseFormat] = None,
+        index_dtype: Optional[IndexDtype] = None,
+        dtype: DtypePolicy = "float64",
+    ) -> Iterator[Example]:
+        """
+        Retrieve the examples in a pipeline, yielding each as soon as it is loaded.
+
+        Examples served from the memory or converted cache skip the download
+        and parsing stages. The statistics of every example are stored in
+        `Example.stats` and passed to the hooks, as with `Example.retrieve`.
+
+        The parse workers are separate processes started with 'spawn', so
+        scripts calling this must guard their entry point with
+        `if __name__ == "__main__":`.
+
+        Args:
+            download_workers (int, optional): Number of parallel downloads. Defaults to 4.
+            parse_workers (int, optional): Number of processes parsing MAT files. Defaults to None,
+                the number of CPUs; 0 parses in the download threads instead.
+            max_in_flight (int, optional): Maximum number of examples loaded ahead of the consumer. Defaults to 8.
+            ordered (bool, optional): Yield the examples in the order of `ids` instead of as they finish.
+                Defaults to False.
+            skip_errors (bool, optional): Log examples that fail to load and continue, instead of raising.
+                Defaults to False.
+            copy (bool, optional): Copy matrices that already have the target dtype during validation. Defaults to False.
+            converted (bool, optional): Load from and store to the converted cache. Defaults to `Settings.converted_cache`.
+            sparse_format (SparseFormat, optional): 'csr' or 'csc' to convert sparse matrices to. Defaults to None.
+            index_dtype (IndexDtype, optional): 'int32' or 'int64' index arrays of sparse matrices. Defaults to None.
+            dtype (DtypePolicy, optional): 'float64', 'float32' or 'keep' the dtype of the MAT file. Defaults to 'float64'.
+
+        Yields:
+            Example: The loaded examples.
+
+        Raises:
+            ValueError: If `max_in_flight` is less than 1.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1.")
+        if converted is None:
+            converted = self.database.config.converted_cache
+        layout = {"sparse_format": sparse_format, "index_dtype": index_dtype, "dtype": dtype}
+
+        def fetch(example: Example, stats: RetrieveStats):
+            """
+            Download stage: retrieve cached datasets completely, otherwise fetch the data file.
+            """
+            if example._load_cached(copy, False, converted, False, layout, stats):
+                return None
+            example.filepath = example.fetch(progressbar=False, stats=stats)
+            if parse_workers == 0:
+                return _parse(example.filepath)
+            return example.filepath
+
+        ids = iter(self.ids)
+        downloads = ThreadPoolExecutor(max_workers=download_workers)
+        parsers = None
+        if parse_workers != 0:
+            parsers = ProcessPoolExecutor(
+                max_workers=parse_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+        # The stage of every running future, with its example, statistics and start time
+        running: dict[Future, tuple[str, Example, RetrieveStats, float]] = {}
+        submitted: deque[str] = deque()
+        ready: dict[str, Optional[Example]] = {}
+
+        def submit() -> bool:
+            id = next(ids, None)
+            if id is None:
+                return False
+            example = Example(self.database.lookup(id), self.database)
+            stats = RetrieveStats(id=id)
+            running[downloads.submit(fetch, example, stats)] = (
+                "download", example, stats, time.perf_counter()
+            )
+            submitted.append(id)
+            return True
+
+        try:
+            while len(submitted) < max_in_flight and submit():
+                pass
+
+            while submitted:
+                # Yield what is ready, in order or as it finished
+                while submitted and (submitted[0] in ready if ordered else ready):
+                    id = submitted.popleft() if ordered else next(iter(ready))
+                    if not ordered:
+                        submitted.remove(id)
+                    example = ready.pop(id)
+                    if example is not None:
+                        yield example
+                    submit()
+                if not running:
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, example, stats, start = running.pop(future)
+                    id = example.meta["id"]
+                    try:
+                        result = future.result()
+                        if isinstance(result, Path):
+                            running[parsers.submit(_parse, result)] = ("parse", example, stats, start)
+                            continue
+                        if result is not None:
+                            data, stats.parse_seconds = result
+                            example._validate(data, copy, converted, layout, stats)
+                    except Exception as e:
+                        if not skip_errors:
+                            raise
+                        logger.warning(f"Loading [yellow]{id}[/yellow] failed: {e!r}")
+                        ready[id] = None
+                        continue
+                    stats.total_seconds = time.perf_counter() - start
+                    example._finish(stats)
+                    ready[id] = example
+        finally:
+            for future in running:
+                future.cancel()
+            downloads.shutdown(wait=True, cancel_futures=True)
+            if parsers is not None:
+                parsers.shutdown(wait=True, cancel_futures=True)
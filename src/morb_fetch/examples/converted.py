@@ -0,0 +1,260 @@
+"""
+Converted cache: Validated datasets stored as native numpy arrays, keyed by the hash of their source file
+"""
+
+import os
+import json
+import zlib
+import shutil
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from morb_fetch.examples import datasets
+from morb_fetch.examples.datasets import DataSet
+from morb_fetch.locking import LOCK_SUFFIX, FileLock, lock_path
+from morb_fetch._types import DtypePolicy, IndexDtype, SparseFormat
+
+logger = logging.getLogger("morb_fetch")
+
+SPARSE_FORMATS = {
+    ("csr", "matrix"): sp.csr_matrix,
+    ("csc", "matrix"): sp.csc_matrix,
+    ("csr", "array"): sp.csr_array,
+    ("csc", "array"): sp.csc_array,
+}
+
+# Byte alignment of the arrays in `data.bin`
+ALIGNMENT = 64
+
+
+def layout_key(
+    filehash: str,
+    sparse_format: Optional[SparseFormat] = None,
+    index_dtype: Optional[IndexDtype] = None,
+    dtype: DtypePolicy = "float64",
+) -> str:
+    """
+    The key of a dataset converted with a sparse layout (see `Matrix.layout`)
+    and dtype policy: `filehash` for the default layout, otherwise with the
+    layout appended, e.g. 'sha256:<digest>.csr-int32-float32'.
+    """
+    options = (sparse_format, index_dtype, dtype if dtype != "float64" else None)
+    layout = "-".join(option for option in options if option)
+    return f"{filehash}.{layout}" if layout else filehash
+
+
+def _shuffle(data: bytes, itemsize: int) -> bytes:
+    """
+    Group the bytes of array elements by significance, e.g. all exponent bytes
+    together, which makes numeric data compress much better.
+    """
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, itemsize).T.tobytes()
+
+
+def _unshuffle(data: bytes, itemsize: int) -> np.ndarray:
+    """
+    Undo `_shuffle`, returning the bytes of the array elements in order.
+    """
+    return np.frombuffer(data, dtype=np.uint8).reshape(itemsize, -1).T.copy()
+
+
+class ConvertedCache:
+    """
+    A second-level cache of validated datasets in a fast-loading native format.
+
+    Each dataset is a folder named by the hash of its source file, holding a
+    `data.bin` file with the raw bytes of every dense matrix and of the
+    `data`, `indices` and `indptr` arrays of every sparse matrix (CSR or CSC),
+    and a `meta.json` with the dataset type and the dtype, shape and offset of
+    each array. Loading it reads the arrays directly, with no MAT parsing.
+
+    Datasets converted to a sparse layout or dtype are stored next to it,
+    keyed by `layout_key`, e.g. `<digest>.csr-int32`, so they load in that layout.
+
+    With `compress`, each array is stored byte-shuffled and zlib-compressed,
+    which shrinks sparse index arrays and float data considerably. Compressed
+    arrays are decompressed on load and cannot be memory-mapped.
+
+    Args:
+        root (Path): The directory of the cache.
+        compress (bool, optional): Compress newly stored datasets. Defaults to False.
+    """
+
+    def __init__(self, root: Path, compress: bool = False):
+        self.root = root
+        self.compress = compress
+
+    def path(self, filehash: str) -> Path:
+        """
+        The folder of the dataset converted from the source file with hash `filehash`, or with key `layout_key(...)`.
+        """
+        return self.root / filehash.split(":")[-1]
+
+    def __contains__(self, filehash: str) -> bool:
+        return (self.path(filehash) / "meta.json").exists()
+
+    def save(self, filehash: str, data: DataSet, precision_loss: Optional[dict] = None) -> Path:
+        """
+        Store a validated dataset, unless another process has stored it already.
+        The folder is written under the lock of the dataset and renamed into place when complete.
+
+        Args:
+            filehash (str): The hash of the source file, e.g. 'sha256:...', or a `layout_key`.
+            data (DataSet): The validated dataset.
+            precision_loss (dict, optional): The precision loss of narrowed matrices, kept in `meta.json`.
+
+        Returns:
+            Path: The folder of the converted dataset.
+        """
+        path = self.path(filehash)
+        self.root.mkdir(parents=True, exist_ok=True)
+        with FileLock(lock_path(path)):
+            if filehash in self:
+                return path
+            self._save(path, data, precision_loss or {})
+        logger.info(f"Stored converted dataset {path}")
+        return path
+
+    def _save(self, path: Path, data: DataSet, precision_loss: dict):
+        """
+        Write a converted dataset to `path` while holding its lock.
+        """
+        tmp = path.with_name(path.name + ".part")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        meta = {
+            "type": type(data).__name__,
+            "matrices": {},
+            "arrays": {},
+            "precision_loss": precision_loss,
+        }
+        with open(tmp / "data.bin", "wb") as f:
+
+            def write(name: str, array: np.ndarray):
+                order = "F" if array.flags.f_contiguous and not array.flags.c_contiguous else "C"
+                f.write(b"\0" * (-f.tell() % ALIGNMENT))
+                info = meta["arrays"][name] = {
+                    "dtype": array.dtype.str,
+                    "shape": array.shape,
+                    "order": order,
+                    "offset": f.tell(),
+                }
+                if self.compress:
+                    block = zlib.compress(_shuffle(array.tobytes(order=order), array.itemsize), 1)
+                    info["compressed"] = len(block)
+                    f.write(block)
+                else:
+                    f.write(array.tobytes(order=order))
+
+            for key in type(data).model_fields:
+                value = getattr(data, key)
+                if sp.issparse(value):
+                    if value.format not in ("csr", "csc"):
+                        value = value.tocsr()
+                    for array in ("data", "indices", "indptr"):
+                        write(f"{key}.{array}", getattr(value, array))
+                    meta["matrices"][key] = {
+                        "format": value.format,
+                        "kind": "array" if isinstance(value, sp.sparray) else "matrix",
+                        "shape": value.shape,
+                    }
+                else:
+                    write(key, np.asarray(value))
+                    meta["matrices"][key] = {"format": "dense", "shape": value.shape}
+
+        (tmp / "meta.json").write_text(json.dumps(meta))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    def load(self, filehash: str, mmap: bool = False) -> DataSet:
+        """
+        Load a converted dataset.
+
+        Args:
+            filehash (str): The hash of the source file, e.g. 'sha256:...'.
+            mmap (bool, optional): Return read-only arrays memory-mapped from the cache file,
+                paged in by the OS on demand and shared between processes. Compressed arrays
+                are decompressed into memory instead. Defaults to False.
+
+        Returns:
+            DataSet: The validated dataset.
+
+        Raises:
+            FileNotFoundError: If the dataset has not been converted.
+        """
+        path = self.path(filehash)
+        meta = json.loads((path / "meta.json").read_text())
+
+        def read(f, name: str) -> np.ndarray:
+            info = meta["arrays"][name]
+            if "compressed" in info:
+                f.seek(info["offset"])
+                dtype = np.dtype(info["dtype"])
+                array = _unshuffle(zlib.decompress(f.read(info["compressed"])), dtype.itemsize)
+                return array.view(dtype).reshape(info["shape"], order=info["order"])
+            if mmap:
+                if not np.prod(info["shape"]):
+                    # Empty arrays cannot be memory-mapped
+                    return np.empty(info["shape"], dtype=info["dtype"])
+                return np.memmap(
+                    f,
+                    dtype=info["dtype"],
+                    mode="r",
+                    offset=info["offset"],
+                    shape=tuple(info["shape"]),
+                    order=info["order"],
+                )
+            f.seek(info["offset"])
+            array = np.fromfile(f, dtype=info["dtype"], count=int(np.prod(info["shape"])))
+            return array.reshape(info["shape"], order=info["order"])
+
+        matrices = {}
+        with open(path / "data.bin", "rb") as f:
+            for key, info in meta["matrices"].items():
+                if info["format"] == "dense":
+                    matrices[key] = read(f, key)
+                else:
+                    arrays = tuple(
+                        read(f, f"{key}.{array}") for array in ("data", "indices", "indptr")
+                    )
+                    matrix = SPARSE_FORMATS[info["format"], info["kind"]](
+                        arrays, shape=tuple(info["shape"]), copy=False
+                    )
+                    # Keep the stored index type, which the constructor narrows where it can
+                    matrix.indices, matrix.indptr = arrays[1], arrays[2]
+                    matrices[key] = matrix
+
+        # The matrices were validated before they were stored, validating them again would convert them
+        return getattr(datasets, meta["type"]).model_construct(**matrices)
+
+    def meta(self, filehash: str) -> dict:
+        """
+        The metadata of a converted dataset: its type, arrays and `precision_loss`.
+        """
+        return json.loads((self.path(filehash) / "meta.json").read_text())
+
+    def layouts(self, filehash: str) -> list[Path]:
+        """
+        The folders of a dataset converted to any layout.
+        """
+        path = self.path(filehash)
+        if not self.root.exists():
+            return []
+        return [path] + sorted(
+            folder
+            for folder in self.root.glob(f"{path.name}.*")
+            if not folder.name.endswith((LOCK_SUFFIX, ".part"))
+        )
+
+    def remove(self, filehash: str):
+        """
+        Remove a converted dataset in all its layouts, if present.
+        """
+        for path in self.layouts(filehash):
+            with FileLock(lock_path(path)):
+                shutil.rmtree(path, ignore_errors=True)
@@ -1,16 +1,142 @@
-from typing import Optional
+import os
+import time
+import asyncio
+import threading
+from typing import Iterable, Optional, Union
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urljoin
+from pydantic import BaseModel
+from tqdm.auto import tqdm
 import polars as pl
 import pooch
 import logging
 
 logger = logging.getLogger("morb_fetch")
 
+from morb_fetch import download
 from morb_fetch.config import Settings, get_config
+from morb_fetch.examples.converted import ConvertedCache
+from morb_fetch.examples.manifest import Manifest
+from morb_fetch.examples.memcache import get_dataset_cache
+from morb_fetch.examples.store import ContentStore
+from morb_fetch.locking import FileLock, lock_path
+from morb_fetch.utils import SIZE_UNITS, parse_human_size
+from morb_fetch._types import HumanFileSize, VerifyMode
 
 pooch_logger = pooch.get_logger()
 pooch_logger.setLevel(logging.ERROR)
 
+# Fraction of `Settings.cache_quota` the cache is pruned down to once it exceeds the quota
+QUOTA_LOW_WATER = 0.9
+
+
+def typed_index(frame: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Add typed columns to the string-valued examples index.
+
+    - `category` becomes categorical,
+    - `sourceFilesizeBytes` holds `sourceFilesize` in bytes (Int64),
+    - `n`, `m`, `q` hold the number of states, inputs and outputs (Int64),
+      parsed from ids following the MORWiki convention `<name>_n<n>m<m>q<q>`
+      unless the index has columns of that name.
+
+    Args:
+        frame (pl.LazyFrame): The examples index as read from the CSV file.
+
+    Returns:
+        pl.LazyFrame: The examples index with typed columns.
+    """
+    size = (
+        pl.col("sourceFilesize").str.to_uppercase().str.replace_all(r"\s", "")
+    )
+    columns = [
+        pl.col("category").cast(pl.Categorical),
+        (
+            size.str.extract(r"^([0-9]+(?:\.[0-9]+)?)", 1).cast(pl.Float64)
+            * size.str.extract(r"([A-Z]+)$", 1).replace_strict(
+                SIZE_UNITS, default=None, return_dtype=pl.Int64
+            )
+        )
+        .cast(pl.Int64)
+        .alias("sourceFilesizeBytes"),
+    ]
+
+    names = frame.collect_schema().names()
+    for group, dimension in enumerate(("n", "m", "q"), start=1):
+        if dimension in names:
+            column = pl.col(dimension)
+        else:
+            column = pl.col("id").str.extract(r"_n(\d+)m(\d+)q(\d+)$", group)
+        columns.append(column.cast(pl.Int64, strict=False).alias(dimension))
+
+    return frame.with_columns(columns)
+
+
+class PrefetchSummary(BaseModel):
+    """
+    Outcome of a bulk download with `Database.prefetch`.
+
+    Attributes:
+        fetched (dict[str, Path]): Local data file of every example that is now in the cache.
+        skipped (dict[str, str]): Examples that were not downloaded, e.g. due to `Settings.max_filesize`.
+        failed (dict[str, str]): Examples whose download failed after all retries, with the last error.
+    """
+
+    fetched: dict[str, Path] = {}
+    skipped: dict[str, str] = {}
+    failed: dict[str, str] = {}
+
+    @property
+    def ok(self) -> bool:
+        """True if no download failed."""
+        return not self.failed
+
+
+class IndexDiff(BaseModel):
+    """
+    Changes between two revisions of the examples index, see `Database.refresh`.
+
+    Attributes:
+        added (list[str]): Ids only in the new index.
+        removed (list[str]): Ids only in the old index.
+        changed (list[str]): Ids whose `sourceFilehash` changed.
+    """
+
+    added: list[str] = []
+    removed: list[str] = []
+    changed: list[str] = []
+
+    @property
+    def empty(self) -> bool:
+        """True if no example was added, removed or changed."""
+        return not (self.added or self.removed or self.changed)
+
+
+def diff_index(old: pl.DataFrame, new: pl.DataFrame) -> IndexDiff:
+    """
+    Compare two revisions of the examples index by id and `sourceFilehash`.
+
+    Args:
+        old (pl.DataFrame): The old index.
+        new (pl.DataFrame): The new index.
+
+    Returns:
+        IndexDiff: The added, removed and changed ids.
+    """
+    old_hashes = dict(zip(old["id"].to_list(), old["sourceFilehash"].to_list()))
+    new_hashes = dict(zip(new["id"].to_list(), new["sourceFilehash"].to_list()))
+    return IndexDiff(
+        added=[id for id in new_hashes if id not in old_hashes],
+        removed=[id for id in old_hashes if id not in new_hashes],
+        changed=[
+            id
+            for id, filehash in new_hashes.items()
+            if id in old_hashes and old_hashes[id] != filehash
+        ],
+    )
+
+
 class Database:
     """
     A class to represent the examples database.
@@ -18,48 +144,220 @@ class Database:
     a specific example by name and identifier.
     """
 
-    def __init__(self, config: Optional[Settings] = None):
+    def __init__(self, config: Optional[Settings] = None, verify: Optional[VerifyMode] = None):
         """
         Load the examples from the database.
 
         Args:
             config (Settings, optional): The configuration settings. Defaults to None.
+            verify (VerifyMode, optional): 'full' to hash the index file and rebuild the index
+                instead of trusting its binary cache. Defaults to `Settings.verify`.
         """
         if config is None:
             config = get_config()
+        self.config = config
 
         # Cache directory for downloaded files
         self.cache_dir = (config.cache).expanduser().resolve(strict=False) / "data"
         ## Create directory if it doesn't exist
         if not self.cache_dir.exists():
             logger.info(f"Creating examples cache directory: {self.cache_dir}")
-            self.cache_dir.mkdir(parents=True)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # Record of verified files, to skip hashing unchanged ones
+        self.manifest = Manifest(self.cache_dir / "manifest.json")
+
+        # Data files stored once per content
+        self.store = ContentStore(self.cache_dir / "objects")
+
+        # Converted datasets for fast loading
+        self.converted = ConvertedCache(
+            self.cache_dir / "converted", compress=config.converted_compression
+        )
+
+        # Datasets shared between the examples of the process, within `Settings.memory_cache`
+        self.memory_cache = get_dataset_cache(config)
 
         # Path to the examples database
-        fileurl = urljoin(str(config.serverurl), config.indexfile)
         self.filepath = self.cache_dir / config.indexfile
+        self.data = self._load_index(full=(verify or config.verify) == "full")
+
+        # Index of the row of each example identifier
+        self._index = {id: row for row, id in enumerate(self.data["id"].to_list())}
+
+        # Running total of the cache size for the quota, see `Database.enforce_quota`
+        self._usage: Optional[int] = None
+        self._usage_lock = threading.Lock()
+        logger.info(
+            f"Loaded example database: {str(self.filepath)}"
+        )
+
+    def enforce_quota(self, nbytes: int, keep: Iterable[Path] = ()):
+        """
+        Account for `nbytes` added to the cache and prune it once it exceeds `Settings.cache_quota`.
+
+        The size of the cache is measured once and then kept as a running total,
+        so that bulk downloads do not scan the cache after every file. Once the
+        total exceeds the quota, least recently used entries are evicted down to
+        `QUOTA_LOW_WATER` of the quota and the cache is measured again.
+        Downloads of other processes are only seen when the cache is measured.
+
+        Args:
+            nbytes (int): The bytes added to the cache.
+            keep (Iterable[Path], optional): Paths that must not be removed, e.g. the file just downloaded.
+        """
+        quota = self.config.cache_quota
+        if quota is None:
+            return
+        from morb_fetch.cache import CacheManager
+
+        limit = parse_human_size(quota)
+        with self._usage_lock:
+            manager = CacheManager(self)
+            if self._usage is None:
+                self._usage = manager.usage()
+            else:
+                self._usage += nbytes
+            if self._usage <= limit:
+                return
+            manager.prune(quota=f"{int(limit * QUOTA_LOW_WATER)} B", orphans=False, keep=keep)
+            self._usage = manager.usage()
+
+    def _load_index(self, full: bool = False) -> pl.DataFrame:
+        """
+        Load the examples index, from its binary cache if possible.
+
+        The parsed CSV file is kept as an Arrow IPC file next to it, keyed by
+        `Settings.indexfilehash`, and memory-mapped on later loads. The binary
+        cache is only written for a CSV file matching the hash and stale ones
+        are removed, so it is rebuilt whenever the hash changes. Processes
+        sharing the cache build it one at a time under its lock.
+
+        Args:
+            full (bool, optional): Parse and hash the CSV file, even if unchanged since its last verification.
+
+        Returns:
+            pl.DataFrame: The examples index, all values as strings.
+        """
+        config = self.config
+        stem = Path(config.indexfile).stem
+        digest = config.indexfilehash.split(":")[1]
+        self.index_cache = self.cache_dir / f"{stem}.{digest[:16]}.arrow"
+
+        corrupt = False
+        if not full and self.index_cache.exists():
+            try:
+                data = pl.read_ipc(self.index_cache, memory_map=True)
+                if "id" in data.columns:
+                    return data
+            except Exception as e:
+                logger.info(f"Rebuilding corrupt index cache {self.index_cache}: {e}")
+            corrupt = True
+
         try:
             # Check if the file is readable as a CSV
-            self.data = pl.read_csv(
+            data = pl.read_csv(
                 self.filepath, infer_schema=False, missing_utf8_is_empty_string=True
             )
         except FileNotFoundError:
             logger.info(
                 f"Database {self.filepath} not found. Trying to fetch from server..."
             )
-            self.filepath = pooch.retrieve(
-                url=fileurl,
+            self.filepath = download.retrieve(
+                url=urljoin(str(config.serverurl), config.indexfile),
                 known_hash=config.indexfilehash,
                 path=self.cache_dir,
                 fname=config.indexfile,
                 progressbar=True,
+                max_connections=config.max_connections,
             )
-            self.data = pl.read_csv(
+            self.manifest.record(self.filepath, config.indexfilehash)
+            data = pl.read_csv(
                 self.filepath, infer_schema=False, missing_utf8_is_empty_string=True
             )
+
+        if self.manifest.verified(self.filepath, config.indexfilehash, full=full):
+            with FileLock(lock_path(self.index_cache)):
+                if corrupt or not self.index_cache.exists():
+                    for stale in self.cache_dir.glob(f"{stem}.*.arrow"):
+                        stale.unlink(missing_ok=True)
+                    tmp = self.index_cache.with_suffix(".arrow.part")
+                    data.write_ipc(tmp)
+                    os.replace(tmp, self.index_cache)
+        else:
+            logger.info(
+                f"Database {self.filepath} does not match the index file hash, not caching it."
+            )
+        return data
+
+    def refresh(self, config: Settings, verify: Optional[VerifyMode] = None) -> IndexDiff:
+        """
+        Switch to another revision of the examples index, e.g. after `Settings.indexfilehash` changed.
+
+        The new index is downloaded unless the cached CSV file already matches
+        its hash, and compared to the current one. Only the cache entries of
+        removed and changed examples are invalidated: their links, and the
+        stored data files, converted datasets and in-memory datasets whose hash
+        the new index no longer refers to. All other cached examples stay valid.
+
+        Args:
+            config (Settings): The settings with the new `indexfile` and `indexfilehash`.
+            verify (VerifyMode, optional): 'full' to hash the index file. Defaults to `Settings.verify`.
+
+        Returns:
+            IndexDiff: The added, removed and changed ids.
+        """
+        filepath = self.cache_dir / config.indexfile
+        if not self.manifest.verified(filepath, config.indexfilehash):
+            logger.info(f"Fetching index revision {config.indexfilehash} from server...")
+            digest = config.indexfilehash.split(":")[1]
+            fetched = download.retrieve(
+                url=urljoin(str(config.serverurl), config.indexfile),
+                known_hash=config.indexfilehash,
+                path=self.cache_dir,
+                fname=f"{config.indexfile}.{digest[:16]}",
+                progressbar=True,
+                max_connections=config.max_connections,
+            )
+            os.replace(fetched, filepath)
+            self.manifest.record(filepath, config.indexfilehash)
+
+        new = Database(config, verify=verify)
+        diff = diff_index(self.data, new.data)
+
+        hashes = set(new.data["sourceFilehash"].to_list())
+        invalidated = []
+        for id in diff.removed + diff.changed:
+            meta = self.lookup(id)
+            filehash = meta["sourceFilehash"]
+            self.memory_cache.discard(id)
+            new.memory_cache.discard(id)
+            link = self.cache_dir / meta["category"] / f"{id}.mat"
+            link.unlink(missing_ok=True)
+            invalidated.append(link)
+            if filehash not in hashes:
+                self.store.remove(filehash)
+                self.converted.remove(filehash)
+                invalidated.append(self.store.path(filehash))
+        self.manifest.discard(invalidated)
+
+        self.config = new.config
+        self.converted.compress = new.converted.compress
+        self.filepath = new.filepath
+        self.index_cache = new.index_cache
+        self.data = new.data
+        self._index = new._index
         logger.info(
-            f"Loaded example database: {str(self.filepath)}"
+            f"Refreshed example database: {len(diff.added)} added, "
+            f"{len(diff.removed)} removed, {len(diff.changed)} changed."
         )
+        return diff
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
 
     def list_ids(self):
         """
@@ -68,7 +366,7 @@ class Database:
         Returns:
             list[str]: The list of example identifiers.
         """
-        return self.data["id"].to_list()
+        return list(self._index)
 
     def lookup(self, id: str) -> dict:
         """
@@ -80,18 +378,178 @@ class Database:
         Returns:
             dict: The example data.
         """
-        example = self.data.filter(pl.col("id") == id)
+        row = self._index.get(id)
 
         def log_lookup(id, found):
             status = "found." if found else "not found."
             logger.info(f"Lookup ID [yellow]{id}[/yellow]: {status}")
 
-        if example.is_empty():
+        if row is None:
             log_lookup(id, False)
             raise ValueError("ID not found!")
         else:
             log_lookup(id, True)
-            return example.to_dicts()[0]
+            return self.data.row(row, named=True)
+
+    def _prefetch_candidates(
+        self, ids: Optional[Iterable[str]], summary: PrefetchSummary
+    ) -> list:
+        """
+        Build the examples to prefetch, recording those above `Settings.max_filesize` as skipped.
+        """
+        from morb_fetch.examples.example import Example
+
+        ids = self.list_ids() if ids is None else list(ids)
+        examples = []
+        for id in ids:
+            example = Example(self.lookup(id), self)
+            try:
+                example.check_filesize()
+            except ValueError as e:
+                summary.skipped[id] = str(e)
+            else:
+                examples.append(example)
+        return examples
+
+    @property
+    def frame(self) -> pl.LazyFrame:
+        """
+        The examples index with typed columns (see `typed_index`), evaluated lazily.
+        """
+        return typed_index(self.data.lazy())
+
+    def query(
+        self,
+        category: Union[str, Iterable[str], None] = None,
+        max_size: Optional[HumanFileSize] = None,
+        min_size: Optional[HumanFileSize] = None,
+        max_n: Optional[int] = None,
+        **columns,
+    ) -> pl.LazyFrame:
+        """
+        Select examples from the typed index with vectorized filters.
+
+        Args:
+            category (str or Iterable[str], optional): The category or categories to select.
+            max_size (HumanFileSize, optional): The maximum file size, e.g. '1 GB'.
+            min_size (HumanFileSize, optional): The minimum file size.
+            max_n (int, optional): The maximum number of states.
+            **columns: Further columns of the index to match, with a value or a list of values.
+
+        Returns:
+            pl.LazyFrame: The selected examples, evaluated on `collect()`.
+
+        Raises:
+            ValueError: If a column is not in the index.
+
+        Example:
+            >>> database.query(category="thermal", max_size="1 GB").collect()["id"]
+        """
+        frame = self.frame
+        names = frame.collect_schema().names()
+        filters = []
+
+        if category is not None:
+            columns["category"] = category
+        if max_size is not None:
+            filters.append(pl.col("sourceFilesizeBytes") <= parse_human_size(max_size))
+        if min_size is not None:
+            filters.append(pl.col("sourceFilesizeBytes") >= parse_human_size(min_size))
+        if max_n is not None:
+            filters.append(pl.col("n") <= max_n)
+        for name, value in columns.items():
+            if name not in names:
+                raise ValueError(f"Column {name} not found in the examples index.")
+            if isinstance(value, str) or not isinstance(value, Iterable):
+                filters.append(pl.col(name) == value)
+            else:
+                filters.append(pl.col(name).is_in(list(value)))
+
+        return frame.filter(*filters) if filters else frame
+
+    def prefetch(
+        self,
+        ids: Optional[Iterable[str]] = None,
+        max_workers: int = 4,
+        retries: int = 2,
+        progressbar: bool = True,
+    ) -> PrefetchSummary:
+        """
+        Download and hash-verify the data files of many examples concurrently.
+
+        Files already in the cache are not downloaded again and examples larger
+        than `Settings.max_filesize` are skipped.
+
+        Args:
+            ids (Iterable[str], optional): The example identifiers. Defaults to all examples.
+            max_workers (int, optional): Number of parallel downloads. Defaults to 4.
+            retries (int, optional): Number of retries for a failed download. Defaults to 2.
+            progressbar (bool, optional): Show a progress bar over all files. Defaults to True.
+
+        Returns:
+            PrefetchSummary: The fetched, skipped and failed examples.
+        """
+        summary = PrefetchSummary()
+        examples = self._prefetch_candidates(ids, summary)
+
+        def _fetch(example):
+            for attempt in range(retries + 1):
+                try:
+                    return example.fetch(progressbar=False)
+                except Exception as e:
+                    if attempt == retries:
+                        raise
+                    logger.info(
+                        f"Fetching [yellow]{example.meta['id']}[/yellow] failed ({e}), retrying..."
+                    )
+                    time.sleep(2**attempt)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(_fetch, example): example for example in examples}
+            with tqdm(total=len(futures), unit="file", disable=not progressbar) as bar:
+                for future in as_completed(futures):
+                    id = futures[future].meta["id"]
+                    try:
+                        summary.fetched[id] = future.result()
+                    except Exception as e:
+                        summary.failed[id] = repr(e)
+                    bar.set_postfix_str(id)
+                    bar.update()
+
+        logger.info(
+            f"Prefetched {len(summary.fetched)} examples, "
+            f"skipped {len(summary.skipped)}, failed {len(summary.failed)}."
+        )
+        return summary
+
+    async def aprefetch(self, ids: Optional[Iterable[str]] = None) -> PrefetchSummary:
+        """
+        Asynchronous version of `Database.prefetch`.
+        Downloads overlap on the event loop, at most `max_connections` of the database settings at once.
+
+        Args:
+            ids (Iterable[str], optional): The example identifiers. Defaults to all examples.
+
+        Returns:
+            PrefetchSummary: The fetched, skipped and failed examples.
+        """
+        summary = PrefetchSummary()
+        examples = self._prefetch_candidates(ids, summary)
+
+        results = await asyncio.gather(
+            *(example.afetch() for example in examples), return_exceptions=True
+        )
+        for example, result in zip(examples, results):
+            if isinstance(result, Exception):
+                summary.failed[example.meta["id"]] = repr(result)
+            else:
+                summary.fetched[example.meta["id"]] = result
+
+        logger.info(
+            f"Prefetched {len(summary.fetched)} examples, "
+            f"skipped {len(summary.skipped)}, failed {len(summary.failed)}."
+        )
+        return summary
 
 
 # Singleton pattern for global access
@@ -2,7 +2,8 @@
 Types of datasets: Validate and cast them into workable formats
 """
 
-from typing import Annotated, Any, Union
+from pathlib import Path
+from typing import Annotated, Any, Optional, Union
 from typing_extensions import Doc
 from pydantic import StringConstraints
 from pydantic_core import core_schema
@@ -10,18 +11,56 @@ from pydantic import BaseModel, GetCoreSchemaHandler, StringConstraints, TypeAda
 import numpy as np
 import scipy.sparse as sp
 
+from morb_fetch.utils import loadmat, matvars
+from morb_fetch._types import DtypePolicy, IndexDtype, SparseFormat
+
+# Target dtypes of floating-point and complex matrices per dtype policy
+FLOAT_DTYPES = {
+    "float64": (np.dtype(np.float64), np.dtype(np.complex128)),
+    "float32": (np.dtype(np.float32), np.dtype(np.complex64)),
+}
+
+# Elements compared at a time by `precision_loss`
+LOSS_CHUNK_SIZE = 1 << 16
+
 
 class Matrix:
     """ Matrix: A numpy array or a scipy sparse matrix. """
     @classmethod
     def __get_pydantic_core_schema__(cls, _source_type: Any, handler: GetCoreSchemaHandler) -> core_schema.CoreSchema:
         """ Use a simple validator — no pydantic sub-schema for np.ndarray """
-        return core_schema.no_info_plain_validator_function(cls.validate)
+        return core_schema.with_info_plain_validator_function(cls._validate_with_context)
+
+    @classmethod
+    def _validate_with_context(cls, value: Any, info: core_schema.ValidationInfo) -> np.ndarray:
+        """ Read the copy, dtype and sparse layout policy from the validation context, e.g. `DataSetType.validate_python(data, context={"copy": True, "dtype": "float32"})` """
+        context = info.context or {}
+        return cls.validate(
+            value,
+            copy=context.get("copy", False),
+            sparse_format=context.get("sparse_format"),
+            index_dtype=context.get("index_dtype"),
+            dtype=context.get("dtype", "float64"),
+        )
 
     @classmethod
-    def validate(cls, value: Any) -> np.ndarray:
+    def validate(
+        cls,
+        value: Any,
+        copy: bool = False,
+        sparse_format: Optional[SparseFormat] = None,
+        index_dtype: Optional[IndexDtype] = None,
+        dtype: DtypePolicy = "float64",
+    ) -> np.ndarray:
         """
         Validate the input value and convert to manageable datatypes.
+
+        Arrays and sparse matrices that already have the target dtype
+        (float64, complex128 or int64, or float32 and complex64 with
+        `dtype='float32'`) are passed through without a copy, unless `copy`
+        is True. With `dtype='keep'` no dtype is changed. Sparse matrices are
+        brought into the layout given by `sparse_format` and `index_dtype`,
+        see `Matrix.layout`. See `precision_loss` for the error of narrowing.
         """
         # if value.ndim != 2:
         #     raise ValueError("Expected a 2D float64 matrix")
@@ -29,16 +68,101 @@ class Matrix:
         if not (isinstance(value, np.ndarray) or sp.issparse(value)):
             raise TypeError("Value must be a numpy ndarray or a scipy sparse matrix")
 
-        if np.issubdtype(value.dtype, np.floating):
-            return value.astype(np.float64)
+        if not np.issubdtype(value.dtype, np.number):
+            raise TypeError(f"Unsupported dtype: {value.dtype}")
+
+        if dtype == "keep":
+            value = value.copy() if copy else value
+        elif np.issubdtype(value.dtype, np.floating):
+            value = value.astype(FLOAT_DTYPES[dtype][0], copy=copy)
+        elif np.issubdtype(value.dtype, np.complexfloating):
+            value = value.astype(FLOAT_DTYPES[dtype][1], copy=copy)
+        else:
+            value = value.astype(np.int64, copy=copy)
+
+        if sp.issparse(value) and (sparse_format or index_dtype):
+            value = cls.layout(value, sparse_format, index_dtype)
+        return value
+
+    @staticmethod
+    def layout(
+        value: Any,
+        sparse_format: Optional[SparseFormat] = None,
+        index_dtype: Optional[IndexDtype] = None,
+    ) -> Any:
+        """
+        Convert a sparse matrix to `sparse_format` in canonical form (sorted
+        indices, no duplicates) and store its index arrays as `index_dtype`,
+        widened to int64 if int32 cannot hold its shape and number of nonzeros.
+        A matrix already in the target layout is modified in place, not copied.
+
+        Args:
+            value (scipy.sparse matrix or array): The sparse matrix.
+            sparse_format (SparseFormat, optional): 'csr' or 'csc'. Defaults to None, keeping the format.
+            index_dtype (IndexDtype, optional): 'int32' or 'int64'. Defaults to None, keeping the index type.
+
+        Returns:
+            The sparse matrix in the target layout.
+        """
+        if sparse_format is not None:
+            if value.format != sparse_format:
+                value = value.asformat(sparse_format)
+            value.sum_duplicates()
+
+        if index_dtype is not None and value.format in ("csr", "csc"):
+            dtype = np.dtype(index_dtype)
+            if max(*value.shape, value.nnz) > np.iinfo(dtype).max:
+                dtype = np.dtype(np.int64)
+            value.indices = value.indices.astype(dtype, copy=False)
+            value.indptr = value.indptr.astype(dtype, copy=False)
+        return value
+
+
+def precision_loss(value: Any, validated: Any) -> Optional[float]:
+    """
+    The error of narrowing a matrix during validation: the largest absolute
+    rounding error relative to the largest magnitude of the matrix, or inf if
+    a finite value overflows.
+
+    The error is computed from the validated matrix, comparing at most
+    `LOSS_CHUNK_SIZE` elements at a time so that the temporary arrays stay small.
 
-        if np.issubdtype(value.dtype, np.complexfloating):
-            return value.astype(np.complex128)
+    Args:
+        value (np.ndarray or scipy sparse matrix): The matrix before validation.
+        validated (np.ndarray or scipy sparse matrix): The matrix after validation, see `Matrix.validate`.
 
-        if np.issubdtype(value.dtype, np.integer):
-            return value.astype(np.int64)
+    Returns:
+        float or None: The relative error, or None if validation did not narrow the matrix.
+    """
+    if not np.issubdtype(value.dtype, np.inexact) or validated.dtype.itemsize >= value.dtype.itemsize:
+        return None
+
+    if not sp.issparse(value):
+        before, after = np.atleast_1d(np.asarray(value)), np.atleast_1d(np.asarray(validated))
+    elif validated.format == value.format and value.format in ("csr", "csc") and value.has_canonical_format:
+        before, after = value.data, validated.data
+    else:
+        # The entries were reordered by the layout conversion, narrow them again chunk by chunk
+        before, after = value.data, None
 
-        raise TypeError(f"Unsupported dtype: {value.dtype}")
+    error = scale = 0.0
+    rows = max(1, LOSS_CHUNK_SIZE // max(1, before[:1].size))
+    for start in range(0, len(before), rows):
+        chunk = before[start : start + rows]
+        if after is None:
+            with np.errstate(over="ignore"):
+                narrowed = chunk.astype(validated.dtype)
+        else:
+            narrowed = after[start : start + rows]
+        finite = np.isfinite(chunk)
+        if not finite.all():
+            chunk, narrowed = chunk[finite], narrowed[finite]
+        if not np.isfinite(narrowed).all():
+            return float("inf")
+        if chunk.size:
+            scale = max(scale, float(np.abs(chunk).max()))
+            error = max(error, float(np.abs(chunk - narrowed).max()))
+    return error / scale if scale else 0.0
 
 
 class BaseDataType(BaseModel):
@@ -94,3 +218,76 @@ DataSet = Union[ABCType, ABCEType, ABCDEType, BCKMType, BCEKMType]
 
 DataSetType = TypeAdapter(DataSet)
 """ DataSetType: A TypeAdapter for DataSet. """
+
+
+class LazyDataSet:
+    """
+    A dataset stored in a MATLAB file, whose matrices are read and validated on first access.
+
+    The dataset type is classified by `DataSetType` from the variable names
+    alone, so untouched matrices are never read into memory.
+
+    Args:
+        filepath (Path): The path to the MATLAB file.
+        copy (bool, optional): Copy matrices that already have the target dtype during validation. Defaults to False.
+        sparse_format (SparseFormat, optional): The format of sparse matrices, see `Matrix.layout`. Defaults to None.
+        index_dtype (IndexDtype, optional): The index type of sparse matrices, see `Matrix.layout`. Defaults to None.
+        dtype (DtypePolicy, optional): The precision of the matrices, see `Matrix.validate`. Defaults to 'float64'.
+
+    Attributes:
+        precision_loss (dict[str, float]): The `precision_loss` of each matrix narrowed so far.
+    """
+
+    def __init__(
+        self,
+        filepath: Path,
+        copy: bool = False,
+        sparse_format: Optional[SparseFormat] = None,
+        index_dtype: Optional[IndexDtype] = None,
+        dtype: DtypePolicy = "float64",
+    ):
+        self.filepath = filepath
+        self.copy = copy
+        self.sparse_format = sparse_format
+        self.index_dtype = index_dtype
+        self.dtype = dtype
+        self.precision_loss = {}
+        self._matrices = {}
+
+        # Classify with placeholders in place of the matrices
+        placeholder = np.empty((0, 0))
+        names = matvars(filepath)
+        self.type = type(DataSetType.validate_python(dict.fromkeys(names, placeholder)))
+
+    def __getattr__(self, key: str) -> Any:
+        if key.startswith("_") or key not in self.type.model_fields:
+            raise AttributeError(f"'{self.type.__name__}' object has no attribute '{key}'")
+        if key not in self._matrices:
+            value = loadmat(self.filepath, variable_names=[key])[key]
+            self._matrices[key] = Matrix.validate(
+                value,
+                copy=self.copy,
+                sparse_format=self.sparse_format,
+                index_dtype=self.index_dtype,
+                dtype=self.dtype,
+            )
+            loss = precision_loss(value, self._matrices[key])
+            if loss is not None:
+                self.precision_loss[key] = loss
+        return self._matrices[key]
+
+    def __dir__(self):
+        return [*super().__dir__(), *self.type.model_fields]
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.type.__name__}, loaded={list(self._matrices)})"
+
+    def load(self) -> DataSet:
+        """
+        Read and validate all remaining matrices.
+
+        Returns:
+            DataSet: The validated dataset.
+        """
+        # The matrices are validated on access, validating them again would convert them
+        return self.type.model_construct(**{key: getattr(self, key) for key in self.type.model_fields})
@@ -1,18 +1,46 @@
-from typing import Union
+import asyncio
+from typing import Optional, Union
 from pathlib import Path
 from urllib.parse import urljoin
 import pooch
 import logging
 
+from morb_fetch import download
 from morb_fetch.utils import parse_human_size, loadmat
-from morb_fetch.config import get_config
+from morb_fetch.examples.converted import layout_key
 from morb_fetch.examples.database import Database, get_database
-from morb_fetch.examples.datasets import DataSetType
+from morb_fetch.examples.datasets import DataSet, DataSetType, LazyDataSet, precision_loss
+from morb_fetch.stats import RetrieveStats, array_buffers, emit, timed
+from morb_fetch._types import DtypePolicy, IndexDtype, SparseFormat, VerifyMode
 
 logger = logging.getLogger("morb_fetch")
 pooch_logger = pooch.get_logger()
 pooch_logger.setLevel(logging.ERROR)
 
+def _matrices(data: DataSet) -> list:
+    """
+    The matrices of a dataset.
+    """
+    return [getattr(data, key) for key in type(data).model_fields]
+
+
+def _precision_loss(data: dict, dataset: DataSet, dtype: DtypePolicy) -> dict[str, float]:
+    """
+    The precision loss of the matrices of `dataset` narrowed from the parsed `data`, logged if any.
+    """
+    losses = {}
+    for key in type(dataset).model_fields:
+        loss = precision_loss(data[key], getattr(dataset, key))
+        if loss is not None:
+            losses[key] = loss
+    overflows = [key for key, loss in losses.items() if loss == float("inf")]
+    if overflows:
+        logger.warning(f"Matrices {', '.join(overflows)} overflow {dtype}")
+    elif losses:
+        logger.info(f"Narrowed matrices to {dtype}, largest relative error {max(losses.values()):.1e}")
+    return losses
+
+
 class Example:
     """
     A class to represent an example.
@@ -38,53 +66,375 @@ class Example:
         else:
             raise ValueError("Argument must be an example id string or metadata dict.")
 
-    def retrieve(self):
+    def check_filesize(self) -> None:
         """
-        Retrieve the data associated with the example either from the local cache or from the server.
+        Check the size of the data file against `Settings.max_filesize`.
+
+        Raises:
+            ValueError: If the file size exceeds `Settings.max_filesize`.
+        """
+        filesize = self.meta["sourceFilesize"]
+        threshold = self._database.config.max_filesize
+        if threshold is not None and (
+            parse_human_size(filesize) > parse_human_size(threshold)
+        ):
+            raise ValueError(
+                f"File size {filesize} exceeds maximum download size of {threshold}."
+            )
+
+    def fetch(
+        self,
+        progressbar: bool = True,
+        parts: int = 1,
+        verify: Optional[VerifyMode] = None,
+        stats: Optional[RetrieveStats] = None,
+    ) -> Path:
+        """
+        Download the data file of the example into the local cache, unless it is already there.
+        Interrupted downloads are resumed from the partial file in the cache.
+
+        The content is kept once in the content store of the database, keyed
+        by `sourceFilehash`, and `<category>/<id>.mat` links to it. Examples
+        sharing a file, or an index revision with unchanged content, reuse it.
+
+        A cached file is trusted if its size and modification time match its
+        last verification in the manifest of the database, otherwise it is
+        hashed and downloaded again if it does not match `sourceFilehash`.
+
+        Args:
+            progressbar (bool, optional): Show a download progress bar. Defaults to True.
+            parts (int, optional): Number of byte ranges to download in parallel. Defaults to 1.
+            verify (VerifyMode, optional): 'full' to hash the cached file even if it is unchanged.
+                Defaults to `Settings.verify`.
+            stats (RetrieveStats, optional): Statistics to add the downloaded bytes, download and hash time to.
 
         Returns:
-            None
+            Path: The path to the local data file.
+
+        Raises:
+            ValueError: If the file size exceeds `Settings.max_filesize`.
         """
-        _config = get_config()
+        _config = self._database.config
+        store = self._database.store
+        manifest = self._database.manifest
+        full = (verify or _config.verify) == "full"
+        filehash = self.meta["sourceFilehash"]
         filename = self.meta["id"] + ".mat"
-        filesize = self.meta["sourceFilesize"]
         filefolder = self._database.cache_dir / self.meta["category"]
-        filefolder.mkdir(parents=True, exist_ok=True)
-        threshold = _config.max_filesize
-
         filepath = filefolder / filename
-        try:
-            data = loadmat(filepath)
-        except OSError:
-            if threshold is None or (
-                parse_human_size(filesize) <= parse_human_size(threshold)
-            ):
-                logger.info(
-                    f"Data file {str(filepath)} not found. Trying to fetch from zenodo/server..."
-                )
-                fileurl = self.meta["zenodoLink"]
-                if not fileurl.strip():
-                    fileurl = urljoin(
-                        str(_config.serverurl), self.meta["category"] + "/" + filename
-                    )
-                filepath = pooch.retrieve(
-                    url=fileurl,
-                    known_hash=self.meta["sourceFilehash"],
-                    path=filefolder,
-                    fname=filename,
-                    progressbar=True,
-                )
+
+        if filehash in store:
+            with timed(stats, "hash_seconds"):
+                verified = manifest.verified(store.path(filehash), filehash, full=full)
+            if verified:
+                try:
+                    return store.link(filehash, filepath)
+                except FileNotFoundError:
+                    logger.info(f"Cached data file of {self.meta['id']} was pruned, downloading it again")
             else:
-                raise ValueError(
-                    f"File size {filesize} exceeds maximum download size of {threshold}."
+                logger.warning(
+                    f"Cached data file of {self.meta['id']} does not match its hash, downloading it again"
                 )
+                store.remove(filehash)
+        else:
+            with timed(stats, "hash_seconds"):
+                verified = manifest.verified(filepath, filehash, full=full)
+            if verified:
+                manifest.record(store.adopt(filepath, filehash), filehash)
+                return store.link(filehash, filepath)
+
+        self.check_filesize()
+
+        logger.info(
+            f"Data file {str(filepath)} not found. Trying to fetch from zenodo/server..."
+        )
+        fileurl = self.meta["zenodoLink"]
+        if not fileurl.strip():
+            fileurl = urljoin(
+                str(_config.serverurl), self.meta["category"] + "/" + filename
+            )
+        blob = download.retrieve(
+            url=fileurl,
+            known_hash=filehash,
+            path=store.root,
+            fname=store.path(filehash).name,
+            progressbar=progressbar,
+            parts=parts,
+            stats=stats,
+            max_connections=_config.max_connections,
+        )
+        manifest.record(blob, filehash)
+        store.link(filehash, filepath)
+
+        self._database.enforce_quota(blob.stat().st_size, keep=[filepath, blob])
+        return filepath
+
+    async def afetch(
+        self,
+        progressbar: bool = False,
+        verify: Optional[VerifyMode] = None,
+        stats: Optional[RetrieveStats] = None,
+    ) -> Path:
+        """
+        Asynchronous version of `Example.fetch`.
+        Concurrent downloads share the connection pool and are capped at `max_connections` of the database settings.
+
+        Args:
+            progressbar (bool, optional): Show a download progress bar. Defaults to False.
+            verify (VerifyMode, optional): 'full' to hash the cached data file even if it is unchanged. Defaults to `Settings.verify`.
+            stats (RetrieveStats, optional): Statistics to add the downloaded bytes, download and hash time to.
+
+        Returns:
+            Path: The path to the local data file.
+        """
+        return await download.run_limited(
+            self.fetch,
+            progressbar=progressbar,
+            verify=verify,
+            stats=stats,
+            max_connections=self._database.config.max_connections,
+        )
+
+    def retrieve(
+        self,
+        copy: bool = False,
+        lazy: bool = False,
+        converted: Optional[bool] = None,
+        mmap: bool = False,
+        verify: Optional[VerifyMode] = None,
+        sparse_format: Optional[SparseFormat] = None,
+        index_dtype: Optional[IndexDtype] = None,
+        dtype: DtypePolicy = "float64",
+    ):
+        """
+        Retrieve the data associated with the example either from the local cache or from the server.
+
+        Sparse matrices keep the format of the MAT file (usually CSC), unless
+        `sparse_format` or `index_dtype` request another layout, see `Matrix.layout`.
+        They are converted once; the converted cache stores each requested
+        layout, so later retrievals in that layout load it without conversion.
+
+        Matrices are widened to float64 (complex128) by default. With
+        `dtype='float32'` they are narrowed to float32 (complex64), halving
+        their memory; the relative rounding error of each narrowed matrix is
+        reported in `Example.stats.precision_loss` and logged.
 
-            data = loadmat(Path(filepath)) # Load MAT
+        The timings and byte counters of the call are stored as `Example.stats`
+        and passed to the callbacks registered with `morb_fetch.stats.add_stats_hook`.
 
+        Args:
+            copy (bool, optional): Copy matrices that already have the target dtype during validation. Defaults to False.
+            lazy (bool, optional): Read and validate each matrix only on first access, e.g. `example["A"]`. Defaults to False.
+            converted (bool, optional): Load from and store to the converted cache, skipping MAT parsing. Defaults to `Settings.converted_cache`.
+            mmap (bool, optional): Return read-only matrices memory-mapped from the converted cache (implies `converted`).
+                The OS pages them in on demand and processes on the same node share one copy. Defaults to False.
+            verify (VerifyMode, optional): 'full' to hash the cached data file even if it is unchanged, see `Example.fetch`.
+                Datasets served from the memory or converted cache do not read the data file. Defaults to `Settings.verify`.
+            sparse_format (SparseFormat, optional): 'csr' or 'csc' to convert sparse matrices to, in canonical form. Defaults to None.
+            index_dtype (IndexDtype, optional): 'int32' or 'int64' index arrays of sparse matrices. 'int32' is
+                used only where it can hold the indices. Defaults to None.
+            dtype (DtypePolicy, optional): 'float64', 'float32' or 'keep' the dtype of the MAT file. Defaults to 'float64'.
+
+        Returns:
+            None
+        """
+        stats = RetrieveStats(id=self.meta["id"])
+        layout = {"sparse_format": sparse_format, "index_dtype": index_dtype, "dtype": dtype}
+        with timed(stats, "total_seconds"):
+            self._retrieve(copy, lazy, converted, mmap, verify, layout, stats)
+        self._finish(stats)
+
+    def _retrieve(
+        self,
+        copy: bool,
+        lazy: bool,
+        converted: Optional[bool],
+        mmap: bool,
+        verify: Optional[VerifyMode],
+        layout: dict,
+        stats: RetrieveStats,
+        share: bool = True,
+    ):
+        """
+        Retrieve the data, recording the phases in `stats`. See `Example.retrieve`.
+        With `share` False, the memory cache is bypassed.
+        """
+        if converted is None:
+            converted = mmap or self._database.config.converted_cache
+        if self._load_cached(copy, lazy, converted, mmap, layout, stats, share):
+            return
+        if mmap:
+            # Convert from the MAT file, a dataset in memory is not in the converted cache
+            self._retrieve(False, False, True, False, verify, layout, stats, share=False)
+            self._load_cached(copy, lazy, converted, mmap, layout, stats, share)
+            return
+        filepath = self.fetch(verify=verify, stats=stats)
+        self._load(filepath, copy, lazy, converted, layout, stats, share)
+
+    async def _aretrieve(
+        self,
+        copy: bool,
+        lazy: bool,
+        converted: Optional[bool],
+        mmap: bool,
+        verify: Optional[VerifyMode],
+        layout: dict,
+        stats: RetrieveStats,
+        share: bool = True,
+    ):
+        """
+        Asynchronous version of `Example._retrieve`, running its blocking stages in worker threads.
+        """
+        if converted is None:
+            converted = mmap or self._database.config.converted_cache
+        if await asyncio.to_thread(self._load_cached, copy, lazy, converted, mmap, layout, stats, share):
+            return
+        if mmap:
+            await self._aretrieve(False, False, True, False, verify, layout, stats, share=False)
+            await asyncio.to_thread(self._load_cached, copy, lazy, converted, mmap, layout, stats, share)
+            return
+        filepath = await self.afetch(verify=verify, stats=stats)
+        await asyncio.to_thread(self._load, filepath, copy, lazy, converted, layout, stats, share)
+
+    def _load_cached(
+        self,
+        copy: bool,
+        lazy: bool,
+        converted: bool,
+        mmap: bool,
+        layout: dict,
+        stats: RetrieveStats,
+        share: bool = True,
+    ) -> bool:
+        """
+        Load the dataset from the memory or converted cache.
+
+        Returns:
+            bool: False if neither cache holds it.
+        """
+        converted_key = layout_key(self.meta["sourceFilehash"], **layout)
+        cache = self._database.converted
+
+        # Datasets shared in the process, unless they are copied, lazy or mapped
+        memory_cache = self._database.memory_cache
+        key = (self.meta["id"], converted_key)
+        shared = share and memory_cache.budget > 0 and not (copy or lazy or mmap)
+        if shared:
+            entry = memory_cache.get(key)
+            if entry is not None:
+                self.data, self.filepath, stats.precision_loss = entry
+                stats.source = "memory"
+                return True
+
+        if converted and not lazy and converted_key in cache:
+            self.filepath = cache.path(converted_key)
+            with timed(stats, "load_seconds"):
+                self.data = cache.load(converted_key, mmap=mmap)
+            if converted_key != self.meta["sourceFilehash"]:
+                stats.precision_loss = cache.meta(converted_key).get("precision_loss", {})
+            stats.source = "converted"
+            if shared:
+                memory_cache.put(key, self.data, self.filepath, stats.precision_loss)
+            return True
+        return False
+
+    def _load(
+        self,
+        filepath: Path,
+        copy: bool,
+        lazy: bool,
+        converted: bool,
+        layout: dict,
+        stats: RetrieveStats,
+        share: bool = True,
+    ):
+        """
+        Load the dataset from the fetched data file `filepath`, storing it in the converted and memory cache.
+        """
         self.filepath = filepath
-        self.data = DataSetType.validate_python(data) # Validate and categorize dataset
+        if lazy:
+            self.data = LazyDataSet(filepath, copy=copy, **layout)
+            stats.precision_loss = self.data.precision_loss
+            stats.source = "lazy"
+            return
+
+        with timed(stats, "parse_seconds"):
+            data = loadmat(filepath) # Load MAT
+        self._validate(data, copy, converted, layout, stats, share)
 
-        logger.info(f"Loaded example data from {str(filepath)}")
+    def _validate(
+        self,
+        data: dict,
+        copy: bool,
+        converted: bool,
+        layout: dict,
+        stats: RetrieveStats,
+        share: bool = True,
+    ):
+        """
+        Validate the variables `data` parsed from `Example.filepath`, see `Example._load`.
+        """
+        with timed(stats, "validate_seconds"):
+            self.data = DataSetType.validate_python(data, context={"copy": copy, **layout}) # Validate and categorize dataset
+        stats.precision_loss = _precision_loss(data, self.data, layout["dtype"])
+        stats.source = "mat"
+        stats.peak_nbytes = sum(
+            {**array_buffers(data.values()), **array_buffers(_matrices(self.data))}.values()
+        )
+        converted_key = layout_key(self.meta["sourceFilehash"], **layout)
+        if converted:
+            with timed(stats, "convert_seconds"):
+                self._database.converted.save(converted_key, self.data, precision_loss=stats.precision_loss)
+        memory_cache = self._database.memory_cache
+        if share and memory_cache.budget > 0 and not copy:
+            memory_cache.put((self.meta["id"], converted_key), self.data, self.filepath, stats.precision_loss)
+
+    def _finish(self, stats: RetrieveStats):
+        """
+        Complete the statistics of a retrieval, store them in `Example.stats` and pass them to the hooks.
+        """
+        if not isinstance(self.data, LazyDataSet):
+            stats.nbytes = sum(array_buffers(_matrices(self.data)).values())
+            stats.peak_nbytes = max(stats.peak_nbytes, stats.nbytes)
+        self.stats = stats
+        logger.info(
+            f"Loaded example data from {str(self.filepath)} ({stats.source}) in {stats.total_seconds:.3f} s"
+        )
+        emit(stats)
+
+    async def aretrieve(
+        self,
+        copy: bool = False,
+        lazy: bool = False,
+        converted: Optional[bool] = None,
+        mmap: bool = False,
+        verify: Optional[VerifyMode] = None,
+        sparse_format: Optional[SparseFormat] = None,
+        index_dtype: Optional[IndexDtype] = None,
+        dtype: DtypePolicy = "float64",
+    ):
+        """
+        Asynchronous version of `Example.retrieve`, with the same options and caches.
+        The download is capped like `Example.afetch`, loading and parsing run in worker threads.
+
+        Args:
+            copy (bool, optional): Copy matrices that already have the target dtype during validation. Defaults to False.
+            lazy (bool, optional): Read and validate each matrix only on first access. Defaults to False.
+            converted (bool, optional): Load from and store to the converted cache. Defaults to `Settings.converted_cache`.
+            mmap (bool, optional): Return read-only matrices memory-mapped from the converted cache (implies `converted`).
+            verify (VerifyMode, optional): 'full' to hash the cached data file even if it is unchanged. Defaults to `Settings.verify`.
+            sparse_format (SparseFormat, optional): 'csr' or 'csc' to convert sparse matrices to. Defaults to None.
+            index_dtype (IndexDtype, optional): 'int32' or 'int64' index arrays of sparse matrices. Defaults to None.
+            dtype (DtypePolicy, optional): 'float64', 'float32' or 'keep' the dtype of the MAT file. Defaults to 'float64'.
+
+        Returns:
+            None
+        """
+        stats = RetrieveStats(id=self.meta["id"])
+        layout = {"sparse_format": sparse_format, "index_dtype": index_dtype, "dtype": dtype}
+        with timed(stats, "total_seconds"):
+            await self._aretrieve(copy, lazy, converted, mmap, verify, layout, stats)
+        self._finish(stats)
 
     def __getitem__(self, key):
         """
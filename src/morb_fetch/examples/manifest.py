@@ -0,0 +1,171 @@
+"""
+Manifest: Remember verified cache files, so unchanged ones are not hashed again
+"""
+
+import os
+import json
+import contextlib
+import logging
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pooch
+
+from morb_fetch.locking import FileLock, lock_path
+
+logger = logging.getLogger("morb_fetch")
+
+
+class Manifest:
+    """
+    A record of cache files whose hash has been verified.
+
+    For every verified file, the manifest keeps its size, modification time
+    (in nanoseconds) and hash, shared by all processes using the cache. A file
+    whose size and modification time still match its record is trusted without
+    hashing it again, any change to it triggers a full hash.
+
+    Changes are appended to a log next to the manifest file, so recording a
+    file costs a single write whatever the size of the cache. The log is
+    merged into the manifest file when a `Manifest` first reads it.
+
+    Args:
+        path (Path): The manifest file. Recorded paths are relative to its folder.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.log = path.with_suffix(".log")
+        self._records: dict[str, list] = {}
+        # The inodes of the manifest file and log the records were read from, and the replayed length of the log
+        self._loaded: Optional[tuple] = None
+        self._offset = 0
+        self._compacted = False
+        self._lock = threading.Lock()
+
+    def _key(self, filepath: Path) -> str:
+        return Path(filepath).relative_to(self.path.parent).as_posix()
+
+    def _replay(self):
+        """
+        Bring the records up to date with the manifest file and the new entries of its log.
+        """
+        try:
+            snapshot = self.path.stat().st_ino
+        except FileNotFoundError:
+            snapshot = None
+        try:
+            log = open(self.log, "rb")
+        except FileNotFoundError:
+            log = None
+
+        with log or contextlib.nullcontext():
+            loaded = (snapshot, log and os.fstat(log.fileno()).st_ino)
+            if loaded != self._loaded:
+                try:
+                    self._records = json.loads(self.path.read_text())
+                except FileNotFoundError:
+                    self._records = {}
+                except ValueError:
+                    logger.info(f"Discarding corrupt manifest {self.path}")
+                    self._records = {}
+                self._loaded = loaded
+                self._offset = 0
+            if log is None:
+                return
+            log.seek(self._offset)
+            changes = log.read()
+
+        # A line without its newline is still being written
+        end = changes.rfind(b"\n") + 1
+        for line in changes[:end].splitlines():
+            try:
+                key, record = json.loads(line)
+            except ValueError:
+                continue
+            if record is None:
+                self._records.pop(key, None)
+            else:
+                self._records[key] = record
+        self._offset += end
+
+    def _compact(self):
+        """
+        Merge the log into the manifest file.
+        """
+        with FileLock(lock_path(self.path)):
+            self._replay()
+            if self._offset:
+                tmp = self.path.with_name(self.path.name + ".part")
+                tmp.write_text(json.dumps(self._records))
+                os.replace(tmp, self.path)
+                self.log.unlink()
+        self._compacted = True
+
+    def _read(self) -> dict[str, list]:
+        """
+        Read the records, including the changes of other processes and threads.
+        """
+        with self._lock:
+            if not self._compacted:
+                self._compact()
+            self._replay()
+            return self._records
+
+    def _update(self, records: dict[str, Optional[list]]):
+        """
+        Append records to the log of the manifest, removing those set to None.
+        """
+        if not records:
+            return
+        lines = "".join(json.dumps([key, record]) + "\n" for key, record in records.items())
+        with self._lock, FileLock(lock_path(self.path)):
+            with open(self.log, "a") as log:
+                log.write(lines)
+
+    def record(self, filepath: Path, filehash: str):
+        """
+        Record a file as verified to have hash `filehash`.
+
+        Args:
+            filepath (Path): The verified file.
+            filehash (str): Its hash, e.g. 'sha256:...'.
+        """
+        stat = Path(filepath).stat()
+        self._update({self._key(filepath): [stat.st_size, stat.st_mtime_ns, filehash]})
+
+    def discard(self, filepaths: Iterable[Path]):
+        """
+        Forget the records of files, e.g. after removing them.
+        """
+        self._update({self._key(filepath): None for filepath in filepaths})
+
+    def verified(self, filepath: Path, filehash: str, full: bool = False) -> bool:
+        """
+        Check whether a file has hash `filehash`, hashing it only if it changed since its last verification.
+
+        Args:
+            filepath (Path): The file to check.
+            filehash (str): The expected hash, e.g. 'sha256:...'.
+            full (bool, optional): Hash the file even if it is unchanged. Defaults to False.
+
+        Returns:
+            bool: True if the file exists and has hash `filehash`.
+        """
+        try:
+            stat = Path(filepath).stat()
+        except FileNotFoundError:
+            return False
+
+        key = self._key(filepath)
+        record = [stat.st_size, stat.st_mtime_ns, filehash]
+        if not full and self._read().get(key) == record:
+            return True
+
+        if pooch.hashes.hash_matches(str(filepath), filehash):
+            self._update({key: record})
+            return True
+        if key in self._read():
+            self._update({key: None})
+        return False
@@ -0,0 +1,191 @@
+"""
+Memory cache: Loaded datasets shared between Example instances of a process
+"""
+
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from morb_fetch.config import Settings, get_config
+from morb_fetch.examples.datasets import DataSet
+from morb_fetch.utils import parse_human_size
+
+
+def dataset_nbytes(data: DataSet) -> int:
+    """
+    Bytes of matrix storage of a dataset, counting the data, indices and indptr arrays of sparse matrices.
+
+    Args:
+        data (DataSet): The dataset.
+
+    Returns:
+        int: The storage in bytes.
+    """
+    nbytes = 0
+    for key in type(data).model_fields:
+        value = getattr(data, key)
+        if sp.issparse(value):
+            arrays = [getattr(value, name, None) for name in ("data", "indices", "indptr", "row", "col")]
+            nbytes += sum(array.nbytes for array in arrays if isinstance(array, np.ndarray))
+        else:
+            nbytes += value.nbytes
+    return nbytes
+
+
+class DatasetCache:
+    """
+    A process-wide LRU cache of validated datasets with a memory budget.
+
+    Entries are keyed by example id and `sourceFilehash`, with the requested
+    sparse layout appended (see `layout_key`), and the least recently
+    used ones are evicted once their matrix storage exceeds the budget. The
+    precision loss of narrowed datasets is kept with them. Cached
+    matrices are shared by all `Example` instances retrieving them, so they
+    should not be modified in place.
+
+    Args:
+        budget (int): The memory budget in bytes. 0 disables the cache.
+
+    Attributes:
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups not in the cache.
+        evictions (int): Number of entries evicted to stay within the budget.
+        nbytes (int): Bytes of matrix storage currently cached.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[DataSet, Path, dict[str, float], int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return key in self._entries
+
+    def get(self, key: tuple[str, str]) -> Optional[tuple[DataSet, Path, dict[str, float]]]:
+        """
+        Look up a dataset and mark it as most recently used.
+
+        Args:
+            key (tuple[str, str]): The example id and `sourceFilehash`.
+
+        Returns:
+            tuple[DataSet, Path, dict[str, float]] or None: The dataset, the file it was loaded from
+                and the precision loss of its matrices, if cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1], dict(entry[2])
+
+    def put(
+        self,
+        key: tuple[str, str],
+        data: DataSet,
+        filepath: Path,
+        precision_loss: Optional[dict[str, float]] = None,
+    ):
+        """
+        Add a dataset, evicting the least recently used ones beyond the budget.
+        Datasets larger than the budget are not cached.
+
+        Args:
+            key (tuple[str, str]): The example id and `sourceFilehash`.
+            data (DataSet): The validated dataset.
+            filepath (Path): The file the dataset was loaded from.
+            precision_loss (dict[str, float], optional): The precision loss of its matrices, see `RetrieveStats`.
+        """
+        nbytes = dataset_nbytes(data)
+        if nbytes > self.budget:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[3]
+            self._entries[key] = (data, filepath, dict(precision_loss or {}), nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.budget:
+                _, (_, _, _, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def remove(self, key: tuple[str, str]):
+        """
+        Remove a dataset, if cached.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.nbytes -= entry[3]
+
+    def discard(self, id: str):
+        """
+        Remove all datasets of an example, in any layout, if cached.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == id]:
+                self.nbytes -= self._entries.pop(key)[3]
+
+    def clear(self):
+        """
+        Remove all datasets and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """
+        The counters of the cache.
+
+        Returns:
+            dict: hits, misses, evictions, entries, nbytes and budget.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "nbytes": self.nbytes,
+            "budget": self.budget,
+        }
+
+
+# Singleton pattern for global access, one cache per budget
+_dataset_caches: dict[int, DatasetCache] = {}
+_dataset_cache_lock = threading.Lock()
+
+
+def get_dataset_cache(config: Optional[Settings] = None) -> DatasetCache:
+    """
+    Get the global dataset cache with the budget of `Settings.memory_cache`.
+
+    Args:
+        config (Settings, optional): The settings with the budget. Defaults to the global settings.
+
+    Returns:
+        DatasetCache: The global dataset cache with this budget.
+    """
+    if config is None:
+        config = get_config()
+    budget = 0 if config.memory_cache is None else parse_human_size(config.memory_cache)
+    with _dataset_cache_lock:
+        cache = _dataset_caches.get(budget)
+        if cache is None:
+            cache = DatasetCache(budget)
+            _dataset_caches[budget] = cache
+
+    return cache
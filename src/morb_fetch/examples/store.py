@@ -0,0 +1,131 @@
+"""
+Content store: Example data files stored once per content, keyed by the hash of their content
+"""
+
+import os
+import shutil
+import logging
+from pathlib import Path
+
+from morb_fetch.locking import FileLock, lock_path
+
+logger = logging.getLogger("morb_fetch")
+
+
+def _link(source: Path, target: Path):
+    """
+    Create `target` as a hard link to `source`, or a symbolic link or copy where hard links are not supported.
+    """
+    try:
+        os.link(source, target)
+        return
+    except OSError:
+        pass
+    try:
+        os.symlink(source.resolve(), target)
+        return
+    except OSError:
+        pass
+    shutil.copy2(source, target)
+
+
+def _same(source: Path, target: Path) -> bool:
+    """
+    Check whether `target` is a link to, or an unmodified copy of, `source`.
+    """
+    if not target.exists():
+        return False
+    if os.path.samefile(source, target):
+        return True
+    a, b = source.stat(), target.stat()
+    return a.st_size == b.st_size and a.st_mtime_ns == b.st_mtime_ns
+
+
+class ContentStore:
+    """
+    A content-addressed store of example data files.
+
+    Each file is stored once as `<root>/<digest>`, named by the hash of its
+    content, however many examples or index revisions refer to it. The paths
+    `<category>/<id>.mat` of the examples are hard links to the stored files,
+    or symbolic links or copies where hard links are not supported. A new
+    index revision therefore only downloads files whose content changed.
+
+    Args:
+        root (Path): The directory of the store.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def path(self, filehash: str) -> Path:
+        """
+        The stored file with hash `filehash`, e.g. 'sha256:...'.
+        """
+        return self.root / filehash.split(":")[-1]
+
+    def __contains__(self, filehash: str) -> bool:
+        return self.path(filehash).exists()
+
+    def adopt(self, filepath: Path, filehash: str) -> Path:
+        """
+        Add an existing file with hash `filehash` to the store, e.g. a data
+        file cached before the store existed. The caller verifies the hash.
+
+        Args:
+            filepath (Path): The file to add.
+            filehash (str): Its hash, e.g. 'sha256:...'.
+
+        Returns:
+            Path: The stored file.
+        """
+        path = self.path(filehash)
+        self.root.mkdir(parents=True, exist_ok=True)
+        with FileLock(lock_path(path)):
+            if path.exists():
+                return path
+            tmp = path.with_name(path.name + ".part")
+            tmp.unlink(missing_ok=True)
+            _link(filepath, tmp)
+            os.replace(tmp, path)
+        logger.info(f"Added {filepath} to the content store")
+        return path
+
+    def remove(self, filehash: str):
+        """
+        Remove a stored file, if present. Links to it keep their content.
+        """
+        path = self.path(filehash)
+        with FileLock(lock_path(path)):
+            path.unlink(missing_ok=True)
+
+    def link(self, filehash: str, filepath: Path) -> Path:
+        """
+        Point `filepath` to the stored file with hash `filehash`, replacing outdated content.
+        The stored file is locked meanwhile, so that it cannot be pruned while it is linked.
+
+        Args:
+            filehash (str): The hash of the stored file, e.g. 'sha256:...'.
+            filepath (Path): The path of the example data file.
+
+        Returns:
+            Path: `filepath`.
+
+        Raises:
+            FileNotFoundError: If the file is not in the store, e.g. because it was just pruned.
+        """
+        source = self.path(filehash)
+        if _same(source, filepath):
+            return filepath
+
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with FileLock(lock_path(source)), FileLock(lock_path(filepath)):
+            if not source.exists():
+                raise FileNotFoundError(f"{source} is not in the content store.")
+            if _same(source, filepath):
+                return filepath
+            tmp = filepath.with_name(filepath.name + ".part")
+            tmp.unlink(missing_ok=True)
+            _link(source, tmp)
+            os.replace(tmp, filepath)
+        return filepath
@@ -0,0 +1,141 @@
+"""
+File locking: Coordinate processes and threads sharing the cache directory
+"""
+
+import os
+import re
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(fd: int) -> bool:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def _unlock(fd: int):
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _try_lock(fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def _unlock(fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+# Suffix of lock files in the cache
+LOCK_SUFFIX = ".lock"
+
+
+def lock_path(path: Union[str, Path]) -> Path:
+    """
+    The lock file guarding the cache file or folder `path` and its partial downloads.
+
+    Partial files, e.g. `<name>.part` or `<name>.part.0`, share the lock of `<name>`.
+    """
+    path = Path(path)
+    return path.with_name(re.sub(r"\.part(\.\d+)?$", "", path.name) + LOCK_SUFFIX)
+
+
+class FileLock:
+    """
+    An exclusive advisory lock on a file, held by at most one process or thread at a time.
+
+    The lock is released by the operating system if its holder dies, so an
+    interrupted download never blocks the cache. Lock files are left in place,
+    deleting them while another process waits would break the mutual exclusion.
+
+    Args:
+        path (Path): The lock file, created if missing.
+        timeout (float, optional): Seconds to wait for the lock. Defaults to None, waiting forever.
+        poll_interval (float, optional): Seconds between attempts to take the lock. Defaults to 0.05.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        timeout: Optional[float] = None,
+        poll_interval: float = 0.05,
+    ):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd: Optional[int] = None
+
+    @property
+    def locked(self) -> bool:
+        """True if this instance holds the lock."""
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Take the lock.
+
+        Args:
+            blocking (bool, optional): Wait until the lock is free. Defaults to True.
+
+        Returns:
+            bool: True if the lock was taken, False if it is held elsewhere and `blocking` is False.
+
+        Raises:
+            TimeoutError: If the lock is not free within `timeout` seconds.
+        """
+        if self._fd is not None:
+            raise RuntimeError(f"Lock {self.path} is already held.")
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        start = time.monotonic()
+        while not _try_lock(fd):
+            if not blocking:
+                os.close(fd)
+                return False
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                os.close(fd)
+                raise TimeoutError(f"Timed out waiting for lock {self.path}.")
+            time.sleep(self.poll_interval)
+        self._fd = fd
+        return True
+
+    def release(self):
+        """
+        Release the lock, if held.
+        """
+        if self._fd is None:
+            return
+        try:
+            _unlock(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def is_locked(path: Union[str, Path]) -> bool:
+    """
+    Check whether the lock guarding the cache file or folder `path` is held.
+    """
+    lock = FileLock(lock_path(path))
+    if not lock.path.exists():
+        return False
+    if lock.acquire(blocking=False):
+        lock.release()
+        return False
+    return True
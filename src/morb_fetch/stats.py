@@ -0,0 +1,134 @@
+"""
+Statistics: Per-phase timings and byte counters of example retrievals
+"""
+
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Literal, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger("morb_fetch")
+
+
+class RetrieveStats(BaseModel):
+    """
+    Timings and byte counters of one `Example.retrieve` call, available as `Example.stats`.
+
+    Phases that did not run, e.g. the download of a cached file, stay at zero.
+
+    Attributes:
+        id (str): The example id.
+        source (str): Where the dataset came from: 'memory', 'converted', 'mat' or 'lazy'.
+        download_bytes (int): Bytes downloaded.
+        download_seconds (float): Time spent downloading.
+        hash_seconds (float): Time spent verifying the hash of the data file.
+            Downloads are hashed while they stream in, as part of `download_seconds`.
+        parse_seconds (float): Time spent parsing the MAT file.
+        validate_seconds (float): Time spent validating and classifying the matrices.
+        load_seconds (float): Time spent loading from the converted cache.
+        convert_seconds (float): Time spent storing to the converted cache.
+        total_seconds (float): Total time of the call.
+        nbytes (int): Bytes of matrix storage of the dataset.
+        peak_nbytes (int): Bytes of matrix storage held at once, parsed and validated matrices together.
+        precision_loss (dict[str, float]): The relative rounding error of each matrix narrowed by the
+            dtype policy, inf if it overflowed; see `morb_fetch.examples.datasets.precision_loss`.
+    """
+
+    id: str
+    source: Literal["memory", "converted", "mat", "lazy"] = "mat"
+    download_bytes: int = 0
+    download_seconds: float = 0.0
+    hash_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    validate_seconds: float = 0.0
+    load_seconds: float = 0.0
+    convert_seconds: float = 0.0
+    total_seconds: float = 0.0
+    nbytes: int = 0
+    peak_nbytes: int = 0
+    precision_loss: dict[str, float] = {}
+
+    @property
+    def download_rate(self) -> float:
+        """Download throughput in bytes per second, 0 if nothing was downloaded."""
+        if not self.download_seconds:
+            return 0.0
+        return self.download_bytes / self.download_seconds
+
+
+@contextmanager
+def timed(stats: Optional[Any], field: str):
+    """
+    Add the time spent in the block to the attribute `field` of `stats`, unless `stats` is None.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            setattr(stats, field, getattr(stats, field) + time.perf_counter() - start)
+
+
+def array_buffers(values: Iterable[Any]) -> dict[int, int]:
+    """
+    The memory buffers of dense and sparse matrices, so that buffers shared
+    between matrices, e.g. views or matrices validated without copying, count once.
+
+    Args:
+        values (Iterable): Matrices; other values are ignored.
+
+    Returns:
+        dict[int, int]: The size in bytes of each buffer, keyed by the id of its owning array.
+    """
+    import numpy as np
+    import scipy.sparse as sp
+
+    buffers = {}
+    for value in values:
+        if sp.issparse(value):
+            arrays = [getattr(value, name, None) for name in ("data", "indices", "indptr", "row", "col")]
+        else:
+            arrays = [value]
+        for array in arrays:
+            if not isinstance(array, np.ndarray):
+                continue
+            while isinstance(array.base, np.ndarray):
+                array = array.base
+            buffers[id(array)] = array.nbytes
+    return buffers
+
+
+# Callbacks receiving the statistics of every retrieval
+_hooks: list[Callable[[RetrieveStats], None]] = []
+
+
+def add_stats_hook(hook: Callable[[RetrieveStats], None]):
+    """
+    Register a callback receiving the `RetrieveStats` of every `Example.retrieve`,
+    e.g. to forward them to a metrics system.
+
+    Args:
+        hook (Callable[[RetrieveStats], None]): The callback.
+    """
+    _hooks.append(hook)
+
+
+def remove_stats_hook(hook: Callable[[RetrieveStats], None]):
+    """
+    Unregister a callback added with `add_stats_hook`, if registered.
+    """
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def emit(stats: RetrieveStats):
+    """
+    Pass statistics to all registered callbacks. Errors in callbacks are logged, not raised.
+    """
+    for hook in list(_hooks):
+        try:
+            hook(stats)
+        except Exception as e:
+            logger.warning(f"Statistics hook {hook!r} failed: {e}")
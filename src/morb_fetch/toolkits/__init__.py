@@ -1,9 +1,26 @@
-from morb_fetch.toolkits.toolkit import ToolkitDownloader
-from morb_fetch.toolkits.morlab import MORLABDownloader
-from morb_fetch.toolkits.mmess import MMESSDownloader
+from typing import TYPE_CHECKING
+
+from morb_fetch.utils import lazy_exports
+
+__getattr__, __dir__ = lazy_exports(
+    __name__,
+    {
+        "ToolkitDownloader": "morb_fetch.toolkits.toolkit",
+        "MORLABDownloader": "morb_fetch.toolkits.morlab",
+        "MMESSDownloader": "morb_fetch.toolkits.mmess",
+        "refresh_snapshot": "morb_fetch.toolkits.toolkit",
+    },
+)
+
+if TYPE_CHECKING:
+    from morb_fetch.toolkits.toolkit import ToolkitDownloader
+    from morb_fetch.toolkits.morlab import MORLABDownloader
+    from morb_fetch.toolkits.mmess import MMESSDownloader
+    from morb_fetch.toolkits.toolkit import refresh_snapshot
 
 __all__ = [
     "ToolkitDownloader",
     "MORLABDownloader",
     "MMESSDownloader",
+    "refresh_snapshot",
 ]
@@ -1,5 +1,4 @@
-from morb_fetch.toolkits.toolkit import ToolkitDownloader
-from morb_fetch.config import get_config
+from morb_fetch.toolkits.toolkit import ConfigPath, ToolkitDownloader
 
 
 class MORLABDownloader(ToolkitDownloader):
@@ -10,4 +9,4 @@ class MORLABDownloader(ToolkitDownloader):
         "4.0": "doi:10.5281/zenodo.1574083",
         "3.0": "doi:10.5281/zenodo.842659",
     }
-    download_path = get_config().morlab_path
+    download_path = ConfigPath("morlab_path")
@@ -1,15 +1,80 @@
+import os
+import json
+import zlib
 import pooch
+import functools
+import asyncio
 import logging
-from typing import ClassVar
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import ClassVar, Iterable, Optional
 from pydantic import BaseModel
 from pathlib import Path
 
+from morb_fetch import download
+from morb_fetch.config import get_config
+from morb_fetch.locking import FileLock, lock_path
 from morb_fetch._types import DOIstr
 
 logger = logging.getLogger("morb_fetch")
 pooch_logger = pooch.get_logger()
 pooch_logger.setLevel("WARNING")
 
+# Registries of Zenodo records, by cache file
+_registries: dict[Path, dict[str, dict[str, str]]] = {}
+
+@functools.lru_cache
+def _read_snapshot(path: Path) -> dict[str, dict[str, dict]]:
+    """
+    Read a registry snapshot: the DOI and files of each version, by toolkit name and version.
+    """
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logger.info(f"Ignoring corrupt toolkit registry snapshot {path}")
+        return {}
+
+
+def _crc32(path: Path) -> int:
+    """
+    The CRC-32 of a file, as stored for the members of a ZIP archive.
+    """
+    crc = 0
+    with open(path, "rb") as f:
+        while block := f.read(download.DEFAULT_CHUNK_SIZE):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+def _matches(path: Path, size: int, crc: int, mtime_ns: Optional[int] = None) -> bool:
+    """
+    Check whether `path` is a file of `size` bytes with CRC-32 `crc`.
+    A file still having the modification time `mtime_ns` of its last check is not read again.
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return False
+    return stat.st_size == size and (stat.st_mtime_ns == mtime_ns or _crc32(path) == crc)
+
+
+class ConfigPath:
+    """
+    A class attribute read from the global configuration on access, so that
+    the configuration is resolved on first use rather than at import time.
+
+    Args:
+        field (str): The name of the path in `Settings`.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+
+    def __get__(self, obj, owner) -> Path:
+        return getattr(get_config(), self.field)
+
 
 class ToolkitDownloader(BaseModel):
     """
@@ -26,10 +91,143 @@ class ToolkitDownloader(BaseModel):
         """
         return list(cls.registry.keys())
 
+    @classmethod
+    def _fetch_registry(cls, version: str) -> dict[str, dict[str, str]]:
+        """
+        Request the files of the Zenodo record of a version from Zenodo.
+        """
+        doi = cls.registry[version]
+        registry = pooch.create(
+            base_url=doi,
+            path=cls.download_path,
+            registry=None,
+        )
+        repository = pooch.downloaders.doi_to_repository(doi.replace("doi:", ""))
+        repository.populate_registry(registry)
+        return {
+            fname: {"hash": filehash, "url": repository.download_url(fname)}
+            for fname, filehash in registry.registry.items()
+        }
+
+    @classmethod
+    def _snapshot_path(cls) -> Path:
+        """
+        The registry snapshot written by `refresh_snapshot` into `download_path`.
+        """
+        return cls.download_path / ".registries" / "snapshot.json"
+
+    @classmethod
+    def load_registry(cls, version: str) -> dict[str, dict[str, str]]:
+        """
+        Load the files of the Zenodo record of a version.
+
+        The registry is looked up in the snapshot of `refresh_snapshot` in
+        `download_path`. Versions missing from it, or without hashes, are resolved
+        through their DOI. A DOI names an immutable record, so its metadata is requested from
+        Zenodo once and cached in `download_path/.registries`, and in memory.
+
+        Args:
+            version (str): The toolkit version.
+
+        Returns:
+            dict[str, dict[str, str]]: The 'hash' and download 'url' of each file, by file name.
+        """
+        doi = cls.registry[version]
+        snapshot = _read_snapshot(cls._snapshot_path()).get(cls.name, {}).get(version, {})
+        files = snapshot.get("files", {})
+        if (
+            snapshot.get("doi") == doi
+            and files
+            and all(entry["hash"] and entry["url"] for entry in files.values())
+        ):
+            return files
+
+        record = doi.replace("doi:", "").replace("/", "_")
+        cache_file = cls.download_path / ".registries" / f"{record}.json"
+        if cache_file in _registries:
+            return _registries[cache_file]
+
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with FileLock(lock_path(cache_file)):
+            try:
+                files = json.loads(cache_file.read_text())
+            except (FileNotFoundError, ValueError):
+                files = cls._fetch_registry(version)
+                tmp = cache_file.with_name(cache_file.name + ".part")
+                tmp.write_text(json.dumps(files))
+                os.replace(tmp, cache_file)
+        _registries[cache_file] = files
+        return files
+
+    @classmethod
+    def _marker(cls, version: str) -> Path:
+        """
+        The file recording the verified unpacked tree of a version.
+        """
+        return cls.download_path / f".{cls.name}-{version}.installed"
+
+    @classmethod
+    def _installed(cls, version: str, filehash: str) -> bool:
+        """
+        Check whether the tree unpacked from the archive with hash `filehash` is complete and unmodified.
+        Files changed since they were unpacked are checked against the CRC-32 of the archive.
+        """
+        try:
+            marker = json.loads(cls._marker(version).read_text())
+        except (FileNotFoundError, ValueError):
+            return False
+        if marker.get("hash") != filehash:
+            return False
+        try:
+            return all(
+                _matches(cls.download_path / name, *record) for name, record in marker["files"].items()
+            )
+        except TypeError:
+            # A marker without CRC-32s, written by an older version
+            return False
+
+    @classmethod
+    def _extract(cls, version: str, archive: Path, filehash: str):
+        """
+        Unpack an archive into `download_path`, unless its files are already there
+        with the size and CRC-32 recorded in the archive, and record the unpacked tree as verified.
+        """
+        with zipfile.ZipFile(archive) as archive_zip:
+            members = {
+                info.filename: (info.file_size, info.CRC)
+                for info in archive_zip.infolist()
+                if not info.is_dir()
+            }
+            if all(_matches(cls.download_path / name, *member) for name, member in members.items()):
+                logger.info(f"Found unpacked {archive.name}, skipping extraction")
+            else:
+                archive_zip.extractall(cls.download_path)
+        files = {
+            name: [size, crc, (cls.download_path / name).stat().st_mtime_ns]
+            for name, (size, crc) in members.items()
+        }
+        marker = cls._marker(version)
+        tmp = marker.with_name(marker.name + ".part")
+        tmp.write_text(json.dumps({"hash": filehash, "files": files}))
+        os.replace(tmp, marker)
+
     @classmethod
     def retrieve_version(cls, version: str) -> str:
         """
-        Retrieve a specific version of Toolkit
+        Retrieve a specific version of Toolkit.
+
+        Nothing is downloaded or extracted if the unpacked tree of the version
+        was verified before; the archive is hashed while it streams in and
+        unpacked right after, without reading it back for the hash.
+
+        Args:
+            version (str): The toolkit version.
+
+        Returns:
+            str: The folder of the unpacked toolkit.
+
+        Raises:
+            ValueError: If the version is unknown.
         """
         # assert that version is valid
         available_versions = cls.list_available_versions()
@@ -37,25 +235,95 @@ class ToolkitDownloader(BaseModel):
             raise ValueError(f"Version {version} not found. Available versions: {available_versions}")
 
         # metadata
-        doi = cls.registry[version]
         zip_filename = f"{cls.name}-{version}.zip"
+        unzip_path = cls.download_path / f"{cls.name}-{version}"
+        record = cls.load_registry(version)[zip_filename]
 
-        # build downloader from doi
-        downloader = pooch.create(
-            base_url=doi,
-            path=cls.download_path,
-            registry=None,
-        )
-        downloader.load_registry_from_doi()
+        if cls._installed(version, record["hash"]):
+            logger.info(f"{cls.name}-{version} found at {unzip_path}")
+            return str(unzip_path)
 
-        # fetch file
-        downloader.fetch(
-            fname=zip_filename,
-            processor=pooch.Unzip(extract_dir='.'),
-            progressbar=True,
-        )
+        with FileLock(lock_path(unzip_path)):
+            if not cls._installed(version, record["hash"]):
+                # fetch the archive over the pooled session, hashed while it streams in
+                archive = download.retrieve(
+                    url=record["url"],
+                    known_hash=record["hash"],
+                    path=cls.download_path,
+                    fname=zip_filename,
+                    progressbar=True,
+                )
+                cls._extract(version, archive, record["hash"])
 
-        unzip_path = cls.download_path / f"{cls.name}-{version}"
         logger.info(f"{cls.name}-{version} downloaded at {unzip_path}")
-
         return str(unzip_path)
+
+    @classmethod
+    def retrieve_versions(cls, versions: Iterable[str], max_workers: int = 4) -> dict[str, str]:
+        """
+        Retrieve several versions of Toolkit concurrently, so that one version
+        is unpacked while the others are still downloading.
+
+        Args:
+            versions (Iterable[str]): The toolkit versions.
+            max_workers (int, optional): Number of parallel installations. Defaults to 4.
+
+        Returns:
+            dict[str, str]: The folder of each unpacked toolkit, by version.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {version: executor.submit(cls.retrieve_version, version) for version in versions}
+            return {version: future.result() for version, future in futures.items()}
+
+    @classmethod
+    async def aretrieve_version(cls, version: str) -> str:
+        """
+        Asynchronous version of `retrieve_version`
+        """
+        return await download.run_limited(cls.retrieve_version, version)
+
+    @classmethod
+    async def aretrieve_versions(cls, versions: Iterable[str]) -> dict[str, str]:
+        """
+        Asynchronous version of `retrieve_versions`, at most `Settings.max_connections` at once.
+        """
+        versions = list(versions)
+        paths = await asyncio.gather(*(cls.aretrieve_version(version) for version in versions))
+        return dict(zip(versions, paths))
+
+
+def refresh_snapshot(path: Optional[Path] = None) -> list[Path]:
+    """
+    Request the registries of all toolkit versions from Zenodo and store them
+    as a snapshot, so that `retrieve_version` needs no metadata request.
+
+    Args:
+        path (Path, optional): The snapshot file, e.g. to copy to `.registries/snapshot.json` of nodes
+            without internet access. Defaults to `.registries/snapshot.json` in the `download_path` of each toolkit.
+
+    Returns:
+        list[Path]: The snapshot files written.
+    """
+    from morb_fetch.toolkits.mmess import MMESSDownloader
+    from morb_fetch.toolkits.morlab import MORLABDownloader
+
+    downloaders = (MMESSDownloader, MORLABDownloader)
+    snapshot = {}
+    for downloader in downloaders:
+        snapshot[downloader.name] = {
+            version: {"doi": doi, "files": downloader._fetch_registry(version)}
+            for version, doi in downloader.registry.items()
+        }
+        logger.info(f"Refreshed the registry of {len(downloader.registry)} {downloader.name} versions")
+
+    if path is None:
+        paths = list(dict.fromkeys(downloader._snapshot_path() for downloader in downloaders))
+    else:
+        paths = [Path(path)]
+    for path in paths:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".part")
+        tmp.write_text(json.dumps(snapshot, indent=2) + "\n")
+        os.replace(tmp, path)
+    _read_snapshot.cache_clear()
+    return paths
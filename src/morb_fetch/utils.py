@@ -1,22 +1,61 @@
+import importlib
+import importlib.util
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, Optional
 
-from morb_fetch._types import HumanFileSize
+if TYPE_CHECKING:
+    # Only for annotations, pydantic is imported on first use of the package
+    from morb_fetch._types import HumanFileSize
 
-def loadmat(filepath: Path) -> dict:
+# Bytes per unit of a HumanFileSize
+SIZE_UNITS = {
+    "B": 1,
+    "KB": 10**3,
+    "MB": 10**6,
+    "GB": 10**9,
+    "TB": 10**12,
+    "KIB": 2**10,
+    "MIB": 2**20,
+    "GIB": 2**30,
+    "TIB": 2**40,
+}
+
+def loadmat(filepath: Path, variable_names: Optional[Iterable[str]] = None) -> dict:
     """
     Load a MATLAB file using pymatreader.read_mat.
 
     Args:
         filepath (str): The path to the MATLAB file.
+        variable_names (Iterable[str], optional): Only read these variables. Defaults to all.
 
     Returns:
         dict: The loaded MATLAB data.
     """
     from pymatreader import read_mat
-    return read_mat(filepath)
+    return read_mat(filepath, variable_names=variable_names)
 
 
-def parse_human_size(s: HumanFileSize) -> int:
+def matvars(filepath: Path) -> list[str]:
+    """
+    List the variables of a MATLAB file without reading their data.
+
+    Args:
+        filepath (str): The path to the MATLAB file.
+
+    Returns:
+        list[str]: The variable names.
+    """
+    from scipy.io import whosmat
+    try:
+        return [name for name, _, _ in whosmat(filepath)]
+    except NotImplementedError:
+        # MAT v7.3 files are HDF5 files
+        import h5py
+        with h5py.File(filepath, "r") as f:
+            return [name for name in f.keys() if not name.startswith("#")]
+
+
+def parse_human_size(s: "HumanFileSize") -> int:
     """
     Parse a human-readable size string into an integer.
 
@@ -29,23 +68,47 @@ def parse_human_size(s: HumanFileSize) -> int:
     Raises:
         ValueError: If the size string is invalid.
     """
-    units = {
-        "B": 1,
-        "KB": 10**3,
-        "MB": 10**6,
-        "GB": 10**9,
-        "KIB": 2**10,
-        "MIB": 2**20,
-        "GIB": 2**30,
-    }
     s = s.strip().upper().replace(" ", "")
-    for unit in sorted(units.keys(), key=len, reverse=True):
+    for unit in sorted(SIZE_UNITS.keys(), key=len, reverse=True):
         if s.endswith(unit):
             num = float(s[: -len(unit)])
-            return int(num * units[unit])
+            return int(num * SIZE_UNITS[unit])
 
     raise ValueError(f"Could not parse size: {s}")
 
+def lazy_exports(package: str, exports: dict[str, str]) -> tuple[Callable, Callable]:
+    """
+    Build the module-level `__getattr__` and `__dir__` of a package whose
+    public names are imported from their modules on first access.
+
+    Submodules of the package are imported on first access as well.
+
+    Args:
+        package (str): The name of the package.
+        exports (dict[str, str]): The module defining each public name.
+
+    Returns:
+        tuple[Callable, Callable]: The `__getattr__` and `__dir__` functions.
+    """
+    namespace = importlib.import_module(package).__dict__
+
+    def __getattr__(name: str):
+        module = exports.get(name)
+        if module is not None:
+            value = getattr(importlib.import_module(module), name)
+        elif not name.startswith("_") and importlib.util.find_spec(f"{package}.{name}"):
+            value = importlib.import_module(f"{package}.{name}")
+        else:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        namespace[name] = value
+        return value
+
+    def __dir__() -> list[str]:
+        return sorted(set(namespace) | set(exports))
+
+    return __getattr__, __dir__
+
+
 def setup_logging():
     from rich.logging import RichHandler
     import logging
@@ -0,0 +1,119 @@
+import time
+import threading
+from pathlib import Path
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import polars as pl
+import pooch
+import pytest
+import scipy.io
+import scipy.sparse as sp
+
+from morb_fetch.config import Settings
+
+
+class MORBRequestHandler(SimpleHTTPRequestHandler):
+    """ Serve files of a directory, with HTTP Range support, and count the requests per path. """
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        time.sleep(self.server.delay)
+        byte_range = self.headers.get("Range")
+        if byte_range is None:
+            return super().do_GET()
+
+        self.server.ranges.append(byte_range)
+        filepath = Path(self.translate_path(self.path))
+        size = filepath.stat().st_size
+        start, end = byte_range.removeprefix("bytes=").split("-")
+        start, end = int(start), int(end) if end else size - 1
+        if start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.end_headers()
+            return
+
+        end = min(end, size - 1)
+        self.send_response(206)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        with open(filepath, "rb") as f:
+            f.seek(start)
+            self.wfile.write(f.read(end - start + 1))
+
+    def end_headers(self):
+        self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def morb_server(tmp_path, monkeypatch):
+    """
+    Local HTTP server standing in for the MORB server.
+
+    Serves a small `examples.csv` index with synthetic examples. The
+    settings pointing to it, with the cache in `tmp_path`, are available
+    as `morb_server.config`, the requested paths as `morb_server.requests`
+    and the requested byte ranges as `morb_server.ranges`. Set
+    `morb_server.delay` to slow down every response by that many seconds.
+    """
+    root = tmp_path / "server"
+    root.mkdir()
+
+    rng = np.random.default_rng(0)
+    rows = []
+    for i, n in enumerate([10, 20, 40]):
+        id = f"synthetic_n{n}m1q1"
+        category = "synthetic"
+        data = {
+            "A": sp.random(n, n, density=0.2, format="csc", random_state=i),
+            "B": rng.standard_normal((n, 1)),
+            "C": rng.standard_normal((1, n)),
+            "E": sp.eye(n, format="csc"),
+        }
+        (root / category).mkdir(exist_ok=True)
+        filepath = root / category / f"{id}.mat"
+        scipy.io.savemat(filepath, data)
+        rows.append(
+            {
+                "id": id,
+                "category": category,
+                "sourceFilesize": f"{filepath.stat().st_size} B",
+                "sourceFilehash": "sha256:" + pooch.file_hash(str(filepath)),
+                "zenodoLink": "",
+            }
+        )
+
+    indexfile = root / "examples.csv"
+    pl.DataFrame(rows).write_csv(indexfile)
+
+    handler = partial(MORBRequestHandler, directory=str(root))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.requests = []
+    server.ranges = []
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    config = Settings(
+        serverurl=f"http://127.0.0.1:{server.server_address[1]}/",
+        indexfile="examples.csv",
+        indexfilehash="sha256:" + pooch.file_hash(str(indexfile)),
+        cache=tmp_path / "cache",
+    )
+    server.config = config
+
+    # Datasets in memory belong to the cache of this test
+    monkeypatch.setattr("morb_fetch.examples.memcache._dataset_caches", {})
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
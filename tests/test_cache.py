@@ -0,0 +1,76 @@
+import os
+import time
+
+from morb_fetch.cache import CacheManager
+from morb_fetch.examples import Database, Example
+
+
+def test_cache_entries(morb_server):
+    db = Database(morb_server.config)
+    ids = db.list_ids()
+    db.prefetch(progressbar=False)
+    Example(ids[0], db).retrieve(converted=True)
+
+    manager = CacheManager(db)
+    kinds = [entry.kind for entry in manager.entries()]
+    assert kinds.count("example") == 3 and kinds.count("link") == 3
+    assert kinds.count("converted") == 1
+    assert not any(entry.orphan for entry in manager.entries(verify=True))
+    assert manager.usage() == sum(entry.size for entry in manager.entries())
+
+
+def test_prune_orphans(morb_server):
+    db = Database(morb_server.config)
+    ids = db.list_ids()
+    paths = db.prefetch(progressbar=False).fetched
+    Example(ids[0], db).retrieve(converted=True)
+    hashes = [Example(id, db)["sourceFilehash"] for id in ids]
+
+    # an example removed from the index, a corrupt file and a file cached without the store
+    db.data = db.data.filter(db.data["id"] != ids[0])
+    paths[ids[1]].write_bytes(b"changed")
+    legacy = db.cache_dir / "synthetic" / "legacy_n5m1q1.mat"
+    legacy.write_bytes(b"legacy")
+
+    removed = CacheManager(db).prune(dry_run=True)
+    assert {entry.path for entry in removed} == {
+        db.store.path(hashes[0]),
+        paths[ids[0]],
+        db.converted.path(hashes[0]),
+        legacy,
+    }
+    removed = CacheManager(db).prune(verify=True)
+    assert db.store.path(hashes[1]) in {entry.path for entry in removed}
+    assert all(not entry.path.exists() for entry in removed)
+    assert not paths[ids[1]].exists()
+    assert paths[ids[2]].exists()
+
+
+def test_prune_quota(morb_server):
+    db = Database(morb_server.config)
+    ids = db.list_ids()
+    paths = db.prefetch(progressbar=False).fetched
+
+    # ids[1] is the least recently used
+    now = time.time()
+    for age, id in zip([2, 3, 1], ids):
+        os.utime(paths[id], (now - age * 100, now - age * 100))
+
+    manager = CacheManager(db)
+    quota = manager.usage() - 1
+    removed = manager.prune(quota=f"{quota} B")
+    assert [entry.path for entry in removed] == [db.store.path(Example(ids[1], db)["sourceFilehash"])]
+    assert not paths[ids[1]].exists()
+    assert manager.usage() <= quota
+    assert db.filepath.exists()
+
+
+def test_quota_on_download(morb_server):
+    config = morb_server.config.model_copy(update={"cache_quota": "1 B"})
+    db = Database(config)
+    ids = db.list_ids()
+
+    first = Example(ids[0], db).fetch(progressbar=False)
+    second = Example(ids[1], db).fetch(progressbar=False)
+    assert second.exists() and not first.exists()
+    assert db.filepath.exists()
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from morb_fetch.examples import Database, Example, ExampleCollection
+
+
+def test_collection_load(morb_server):
+    db = Database(morb_server.config)
+    collection = ExampleCollection.from_query(db, category="synthetic")
+    assert collection.ids == db.list_ids()
+
+    examples = list(collection.load(parse_workers=2, ordered=True, dtype="float32"))
+    assert [example["id"] for example in examples] == collection.ids
+    for example in examples:
+        reference = Example(example["id"], db)
+        reference.retrieve(dtype="float32")
+        assert example.stats.source == "mat" and example.stats.parse_seconds > 0
+        assert example["A"].dtype == np.float32
+        assert abs(example["A"] - reference["A"]).max() == 0
+        assert example.stats.precision_loss == reference.stats.precision_loss
+
+
+def test_collection_converted(morb_server):
+    db = Database(morb_server.config)
+    collection = ExampleCollection(db.list_ids(), db)
+    list(collection.load(parse_workers=0, converted=True))
+
+    # a second pass is served by the converted cache
+    examples = list(collection.load(parse_workers=0, converted=True))
+    assert {example["id"] for example in examples} == set(collection.ids)
+    assert all(example.stats.source == "converted" for example in examples)
+
+
+def test_collection_memory_cache(morb_server):
+    db = Database(morb_server.config.model_copy(update={"memory_cache": "1 GB"}))
+    collection = ExampleCollection(db.list_ids(), db)
+    loaded = {example["id"]: example for example in collection.load(parse_workers=0, dtype="float32")}
+
+    # datasets validated in the pipeline are shared with `Example.retrieve`
+    for id, example in loaded.items():
+        warm = Example(id, db)
+        warm.retrieve(dtype="float32")
+        assert warm.stats.source == "memory"
+        assert warm["A"] is example["A"]
+        assert warm.stats.precision_loss == example.stats.precision_loss
+
+
+def test_collection_in_flight(morb_server, monkeypatch):
+    db = Database(morb_server.config)
+    fetched = []
+    fetch = Example.fetch
+
+    def counting_fetch(self, *args, **kwargs):
+        fetched.append(self.meta["id"])
+        return fetch(self, *args, **kwargs)
+
+    monkeypatch.setattr(Example, "fetch", counting_fetch)
+    stream = ExampleCollection(db.list_ids(), db).load(parse_workers=0, max_in_flight=1)
+    next(stream)
+    assert len(fetched) == 1
+    stream.close()
+
+
+def test_collection_errors(morb_server):
+    db = Database(morb_server.config)
+    ids = db.list_ids()
+    db.data = db.data.with_columns(
+        sourceFilehash=db.data["sourceFilehash"].str.replace(r"sha256:..", "sha256:xx")
+    )
+    collection = ExampleCollection(ids, db)
+    with pytest.raises(ValueError, match="does not match the known hash"):
+        list(collection.load(parse_workers=0))
+    assert list(collection.load(parse_workers=0, skip_errors=True)) == []
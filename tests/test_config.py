@@ -2,7 +2,7 @@ import os
 import pytest
 from pathlib import Path
 from platformdirs import user_cache_path
-from morb_fetch.config import get_config, clear_config
+from morb_fetch.config import Settings, create_config, get_config, clear_config
 
 
 @pytest.fixture
@@ -45,3 +45,15 @@ def test_load_yaml_config_from_env(monkeypatch, mock_yaml_file):
     assert config.cache == Path("./.test_cache")
 
     clear_config()
+
+
+def test_create_config(tmp_path):
+    """A generated config file loads with the defaults"""
+    yaml = pytest.importorskip("yaml")
+    yaml_path = tmp_path / "morb_fetch.config.yaml"
+    create_config(yaml_path)
+
+    config = Settings(**yaml.safe_load(yaml_path.read_text()))
+    assert config.max_filesize is None
+    assert config.cache_quota is None
+    assert config.memory_cache is None
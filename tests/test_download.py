@@ -0,0 +1,142 @@
+import asyncio
+import numpy as np
+import pooch
+import pytest
+
+from morb_fetch import download
+from morb_fetch.examples import Database, Example
+
+
+def test_session_is_shared():
+    assert download.get_session() is download.get_session()
+    download.close_session()
+
+
+def test_database_connection_limit(morb_server):
+    config = morb_server.config.model_copy(update={"max_connections": 3})
+    db = Database(config)
+    download.close_session()
+    Example(db.list_ids()[0], db).fetch(progressbar=False)
+
+    assert list(download._sessions) == [3]
+    adapter = download.get_session(3).get_adapter(str(config.serverurl))
+    assert adapter._pool_maxsize == 3 and adapter._pool_block
+    assert download.get_session(3) is not download.get_session()
+    download.close_session()
+
+
+def test_aretrieve(morb_server):
+    db = Database(morb_server.config)
+    examples = [Example(id, db) for id in db.list_ids()]
+
+    async def main():
+        await asyncio.gather(*(example.aretrieve() for example in examples))
+
+    asyncio.run(main())
+    assert [example["A"].shape[0] for example in examples] == [10, 20, 40]
+
+
+def test_aretrieve_caches(morb_server):
+    db = Database(morb_server.config)
+    id = db.list_ids()[1]
+    Example(id, db).retrieve(converted=True, dtype="float32")
+
+    example = Example(id, db)
+    asyncio.run(example.aretrieve(converted=True, dtype="float32"))
+    assert example.stats.source == "converted"
+    assert example.stats.precision_loss
+
+    lazy = Example(id, db)
+    asyncio.run(lazy.aretrieve(lazy=True, dtype="float32"))
+    assert lazy.stats.source == "lazy"
+    lazy["A"]
+    assert lazy.stats.precision_loss == {"A": example.stats.precision_loss["A"]}
+
+    mapped = Example(db.list_ids()[0], db)
+    asyncio.run(mapped.aretrieve(mmap=True))
+    assert mapped.stats.source == "converted"
+    assert isinstance(mapped["B"], np.memmap)
+
+
+def test_aprefetch(morb_server):
+    db = Database(morb_server.config)
+
+    summary = asyncio.run(db.aprefetch())
+    assert summary.ok
+    assert set(summary.fetched) == set(db.list_ids())
+
+
+def test_resume_partial_download(morb_server):
+    db = Database(morb_server.config)
+    example = Example(db.list_ids()[-1], db)
+    source = morb_server.config.cache.parent / "server" / "synthetic"
+    content = (source / f"{example['id']}.mat").read_bytes()
+
+    # leave half of the file from an interrupted download
+    blob = db.store.path(example["sourceFilehash"])
+    blob.parent.mkdir(parents=True)
+    part = blob.with_name(blob.name + ".part")
+    part.write_bytes(content[: len(content) // 2])
+
+    filepath = example.fetch(progressbar=False)
+    assert morb_server.ranges == [f"bytes={len(content) // 2}-"]
+    assert filepath.read_bytes() == content
+    assert not part.exists()
+
+
+def test_parallel_ranges(morb_server):
+    db = Database(morb_server.config)
+    example = Example(db.list_ids()[-1], db)
+
+    filepath = example.fetch(progressbar=False, parts=4)
+    assert len(morb_server.ranges) == 4
+    assert not list(db.store.root.glob("*.part*"))
+
+    example.retrieve()
+    assert example["A"].shape == (40, 40)
+
+
+def test_hash_mismatch(morb_server, tmp_path):
+    url = str(morb_server.config.serverurl) + "examples.csv"
+    path = tmp_path / "downloads"
+    with pytest.raises(ValueError, match="does not match the known hash"):
+        download.retrieve(url, "sha256:" + 64 * "0", path, "examples.csv")
+    assert not (path / "examples.csv").exists()
+    assert not list(path.glob("*.part*"))
+
+
+@pytest.mark.parametrize("parts", [1, 4])
+def test_streaming_hash(morb_server, tmp_path, monkeypatch, parts):
+    """ The download is hashed while it streams in, never read back. """
+    def read_back(*args, **kwargs):
+        raise AssertionError("file hashed after download")
+
+    monkeypatch.setattr(pooch.hashes, "hash_matches", read_back)
+    source = morb_server.config.cache.parent / "server" / "examples.csv"
+    url = str(morb_server.config.serverurl) + "examples.csv"
+    path = tmp_path / "downloads"
+
+    filepath = download.retrieve(url, morb_server.config.indexfilehash, path, "a.csv", parts=parts)
+    assert filepath.read_bytes() == source.read_bytes()
+
+    # resumed downloads include the kept bytes in the hash
+    part = path / "b.csv.part"
+    part.write_bytes(source.read_bytes()[:100])
+    filepath = download.retrieve(url, morb_server.config.indexfilehash, path, "b.csv")
+    assert filepath.read_bytes() == source.read_bytes()
+
+    with pytest.raises(ValueError, match="does not match the known hash"):
+        download.retrieve(url, "sha256:" + 64 * "0", path, "c.csv", parts=parts)
+    assert not list(path.glob("c.csv.part*"))
+
+
+def test_parts_beyond_connection_limit(morb_server):
+    db = Database(morb_server.config.model_copy(update={"max_connections": 1}))
+    example = Example(db.list_ids()[-1], db)
+
+    # the ranges wait for the single pooled connection instead of opening more
+    example.fetch(progressbar=False, parts=4)
+    assert len(morb_server.ranges) == 4
+    example.retrieve()
+    assert example["A"].shape == (40, 40)
+    download.close_session()
@@ -1,7 +1,14 @@
 import os
+import pytest
+import numpy as np
 import polars as pl
+import pooch
+import scipy.sparse as sp
 from morb_fetch.config import get_config
-from morb_fetch.examples import Database, Example
+from morb_fetch.examples import ABCEType, Database, DataSetType, Example, Matrix
+from morb_fetch.examples.converted import layout_key
+from morb_fetch.examples.datasets import precision_loss
+from morb_fetch.examples.memcache import dataset_nbytes
 
 
 def test_database():
@@ -43,5 +50,310 @@ def test_example_initialization():
     assert sample_example_1.meta == sample_example_2.meta
 
 
-def test_example_matrices():
-    pass
+def test_example_matrices(morb_server):
+    db = Database(morb_server.config)
+    for id, n in zip(db.list_ids(), [10, 20, 40]):
+        example = Example(id, db)
+        example.retrieve()
+
+        assert isinstance(example.data, ABCEType)
+        assert sp.issparse(example["A"]) and example["A"].shape == (n, n)
+        assert sp.issparse(example["E"]) and example["E"].shape == (n, n)
+        # pymatreader squeezes vectors
+        assert isinstance(example["B"], np.ndarray) and example["B"].size == n
+        assert isinstance(example["C"], np.ndarray) and example["C"].size == n
+        assert example["A"].dtype == example["B"].dtype == np.float64
+
+
+def test_database_index(morb_server):
+    db = Database(morb_server.config)
+    ids = db.list_ids()
+
+    assert len(db) == len(ids) == db.data.height
+    assert ids[0] in db
+    assert "unknown" not in db
+    assert db.lookup(ids[1]) == db.data.row(1, named=True)
+    with pytest.raises(ValueError):
+        db.lookup("unknown")
+
+
+def test_database_query(morb_server):
+    db = Database(morb_server.config)
+
+    frame = db.query(category="synthetic")
+    assert isinstance(frame, pl.LazyFrame)
+    typed = frame.collect()
+    assert typed.schema["sourceFilesizeBytes"] == pl.Int64
+    assert typed["n"].to_list() == [10, 20, 40]
+
+    sizes = typed["sourceFilesizeBytes"].sort().to_list()
+    selected = db.query(max_size=f"{sizes[1]} B").collect()["id"].to_list()
+    assert len(selected) == 2
+
+    selected = db.query(category=["synthetic", "other"], max_n=20, m=1).collect()
+    assert selected["id"].to_list() == ["synthetic_n10m1q1", "synthetic_n20m1q1"]
+    assert db.query(category="other").collect().is_empty()
+
+    with pytest.raises(ValueError):
+        db.query(dataset_type="ABCE")
+
+
+def test_database_index_cache(morb_server):
+    config = morb_server.config
+    db = Database(config)
+    assert db.index_cache.exists()
+
+    # later loads read the binary cache, not the CSV file
+    db.filepath.unlink()
+    cached = Database(config)
+    assert cached.data.equals(db.data)
+    assert not cached.filepath.exists()
+
+    # a changed index file hash rebuilds the cache
+    indexfile = morb_server.config.cache.parent / "server" / "examples.csv"
+    db.data.head(2).write_csv(indexfile)
+    config = config.model_copy(
+        update={"indexfilehash": "sha256:" + pooch.file_hash(str(indexfile))}
+    )
+    updated = Database(config)
+    assert updated.data.height == 2
+    assert updated.index_cache.exists()
+    assert not db.index_cache.exists()
+
+
+def test_matrix_validation_copy():
+    A = sp.random(5, 5, density=0.3, format="csc", random_state=0)
+    B = np.ones((5, 1))
+    C = np.ones((1, 5), dtype=np.float32)
+
+    data = DataSetType.validate_python({"A": A, "B": B, "C": C})
+    assert data.A is A and data.B is B
+    assert data.C.dtype == np.float64
+
+    data = DataSetType.validate_python({"A": A, "B": B, "C": C}, context={"copy": True})
+    assert data.A is not A and data.B is not B
+    assert np.shares_memory(Matrix.validate(B), B)
+    assert not np.shares_memory(Matrix.validate(B, copy=True), B)
+
+
+def test_matrix_layout():
+    A = sp.random(5, 5, density=0.3, format="csc", random_state=0)
+    A.indices = A.indices.astype(np.int64)
+    A.indptr = A.indptr.astype(np.int64)
+
+    csr = Matrix.validate(A, sparse_format="csr", index_dtype="int32")
+    assert csr.format == "csr" and csr.has_canonical_format
+    assert csr.indices.dtype == csr.indptr.dtype == np.int32
+    assert abs(csr - A).max() == 0
+
+    # a matrix in the target layout is not copied
+    assert Matrix.validate(csr, sparse_format="csr", index_dtype="int32") is csr
+
+    # int32 is widened where it cannot hold the indices
+    wide = sp.csr_matrix((1, 2**31), dtype=np.float64)
+    assert Matrix.layout(wide, index_dtype="int32").indptr.dtype == np.int64
+
+
+def test_lazy_retrieve(morb_server):
+    db = Database(morb_server.config)
+    example = Example(db.list_ids()[0], db)
+    example.retrieve(lazy=True)
+
+    assert example.data.type is ABCEType
+    assert not example.data._matrices
+    assert example["A"].shape == (10, 10)
+    assert list(example.data._matrices) == ["A"]
+
+    data = example.data.load()
+    assert isinstance(data, ABCEType)
+    assert data.A is example["A"]
+    with pytest.raises(AttributeError):
+        example.data.K
+
+    # loading keeps the dtype of the validated matrices
+    narrowed = Example(example["id"], db)
+    narrowed.retrieve(lazy=True, dtype="float32")
+    B = narrowed["B"]
+    data = narrowed.data.load()
+    assert data.B is B and data.A.dtype == np.float32
+
+
+def test_converted_cache(morb_server):
+    db = Database(morb_server.config)
+    id = db.list_ids()[1]
+    example = Example(id, db)
+    example.retrieve(converted=True)
+    assert example["sourceFilehash"] in db.converted
+
+    # a warm retrieval does not need the MAT file
+    example.filepath.unlink()
+    warm = Example(id, db)
+    warm.retrieve(converted=True)
+    assert warm.filepath == db.converted.path(example["sourceFilehash"])
+    assert type(warm.data) is type(example.data)
+    for key in ("A", "B", "C", "E"):
+        assert type(warm[key]) is type(example[key])
+        assert (abs(warm[key] - example[key])).max() == 0
+
+
+def test_mmap_retrieve(morb_server):
+    db = Database(morb_server.config)
+    example = Example(db.list_ids()[2], db)
+    example.retrieve(mmap=True)
+    assert example["sourceFilehash"] in db.converted
+
+    # read-only views of the cache file
+    A = example["A"]
+    assert not any(array.flags.writeable for array in (A.data, A.indices, A.indptr))
+    assert isinstance(example["B"], np.memmap)
+
+    reference = Example(example["id"], db)
+    reference.retrieve(converted=False)
+    assert abs(A - reference["A"]).max() == 0
+    assert np.array_equal(example["C"], reference["C"])
+
+
+def test_mmap_after_memory_cache(morb_server):
+    db = Database(morb_server.config.model_copy(update={"memory_cache": "1 GB"}))
+    id = db.list_ids()[0]
+    Example(id, db).retrieve()
+
+    example = Example(id, db)
+    example.retrieve(mmap=True)
+    assert example.stats.source == "converted"
+    assert isinstance(example["B"], np.memmap)
+
+
+def test_memory_cache(morb_server):
+    db = Database(morb_server.config)
+    assert db.memory_cache.budget == 0
+    ids = db.list_ids()
+    sizes = {}
+    for id in ids:
+        example = Example(id, db)
+        example.retrieve()
+        sizes[id] = dataset_nbytes(example.data)
+
+    assert example.stats.source == "mat"
+
+    # room for the two larger datasets only
+    budget = sizes[ids[1]] + sizes[ids[2]]
+    db = Database(morb_server.config.model_copy(update={"memory_cache": f"{budget} B"}))
+    cache = db.memory_cache
+    assert cache.budget == budget
+
+    first = Example(ids[0], db)
+    first.retrieve()
+    second = Example(ids[0], db)
+    second.retrieve()
+    assert second["A"] is first["A"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    for id in ids[1:]:
+        Example(id, db).retrieve()
+    assert cache.evictions == 1
+    assert (ids[0], first["sourceFilehash"]) not in cache
+    assert cache.nbytes == sizes[ids[1]] + sizes[ids[2]] <= cache.budget
+
+    # copies are never shared
+    third = Example(ids[1], db)
+    third.retrieve(copy=True)
+    assert cache.hits == 1
+
+
+def test_memory_cache_precision_loss(morb_server):
+    db = Database(morb_server.config.model_copy(update={"memory_cache": "1 GB"}))
+    id = db.list_ids()[1]
+    example = Example(id, db)
+    example.retrieve(dtype="float32")
+    assert example.stats.precision_loss
+
+    warm = Example(id, db)
+    warm.retrieve(dtype="float32")
+    assert warm.stats.source == "memory"
+    assert warm.stats.precision_loss == example.stats.precision_loss
+
+
+def test_sparse_layout_retrieve(morb_server):
+    db = Database(morb_server.config)
+    id = db.list_ids()[1]
+    example = Example(id, db)
+    example.retrieve(converted=True, sparse_format="csr", index_dtype="int32")
+    A = example["A"]
+    assert A.format == "csr" and A.indices.dtype == np.int32
+
+    # each layout is stored once, and loaded without conversion
+    filehash = example["sourceFilehash"]
+    key = layout_key(filehash, "csr", "int32")
+    assert key in db.converted and filehash not in db.converted
+    warm = Example(id, db)
+    warm.retrieve(converted=True, sparse_format="csr", index_dtype="int32")
+    assert warm.stats.source == "converted"
+    assert warm.filepath == db.converted.path(key)
+    assert warm["A"].format == "csr" and warm["A"].indices.dtype == np.int32
+    assert abs(warm["A"] - A).max() == 0
+
+    native = Example(id, db)
+    native.retrieve(converted=True, index_dtype="int64")
+    assert native["A"].format == "csc" and native["A"].indices.dtype == np.int64
+    assert native["A"] is not A
+    native.retrieve(converted=True, index_dtype="int64", mmap=True)
+    assert native.stats.source == "converted"
+    assert native["A"].indices.dtype == np.int64
+
+    db.converted.remove(filehash)
+    assert not db.converted.layouts(filehash)[1:]
+
+
+def test_dtype_policy():
+    A = sp.random(5, 5, density=0.3, format="csc", random_state=0)
+    B = np.linspace(0, 1, 7)[1:6].reshape(5, 1)
+    C = np.ones((1, 5), dtype=np.complex128)
+
+    data = DataSetType.validate_python({"A": A, "B": B, "C": C}, context={"dtype": "float32"})
+    assert data.A.dtype == data.B.dtype == np.float32 and data.C.dtype == np.complex64
+    assert 0 < precision_loss(B, data.B) < 1e-7
+    assert precision_loss(C, data.C) == 0.0
+    csr = Matrix.validate(A, sparse_format="csr", dtype="float32")
+    assert 0 < precision_loss(A, data.A) == precision_loss(A, csr)
+    assert precision_loss(B, Matrix.validate(B)) is None
+    huge = np.array([1e300, np.inf])
+    with np.errstate(over="ignore"):
+        assert precision_loss(huge, huge.astype(np.float32)) == float("inf")
+
+    B32 = B.astype(np.float32)
+    assert Matrix.validate(B32, dtype="keep") is B32
+    assert Matrix.validate(B32, dtype="float32") is B32
+    assert Matrix.validate(B32).dtype == np.float64
+
+
+def test_float32_retrieve(morb_server):
+    db = Database(morb_server.config.model_copy(update={"converted_compression": True}))
+    id = db.list_ids()[1]
+    example = Example(id, db)
+    example.retrieve(converted=True, dtype="float32")
+    assert example["A"].dtype == example["B"].dtype == np.float32
+    assert set(example.stats.precision_loss) == {"A", "B", "C", "E"}
+    assert max(example.stats.precision_loss.values()) < 1e-6
+
+    # stored compressed, and the loss is reported for warm loads
+    key = layout_key(example["sourceFilehash"], dtype="float32")
+    assert all("compressed" in info for info in db.converted.meta(key)["arrays"].values())
+    warm = Example(id, db)
+    warm.retrieve(converted=True, mmap=True, dtype="float32")
+    assert warm.stats.source == "converted"
+    assert warm.stats.precision_loss == example.stats.precision_loss
+    assert warm["A"].dtype == warm["B"].dtype == np.float32
+    assert abs(warm["A"] - example["A"]).max() == 0
+    assert np.array_equal(warm["B"], example["B"])
+
+    # uncompressed datasets are mapped from the cache file in their stored dtype
+    db = Database(morb_server.config)
+    id = db.list_ids()[2]
+    Example(id, db).retrieve(converted=True, dtype="float32")
+    mapped = Example(id, db)
+    mapped.retrieve(mmap=True, dtype="float32")
+    assert mapped.stats.source == "converted"
+    assert mapped["B"].dtype == np.float32
+    assert isinstance(mapped["B"], np.memmap)
+    assert mapped["A"].data.base is not None and not mapped["A"].data.flags.writeable
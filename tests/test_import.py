@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+import morb_fetch
+
+
+def test_lazy_import():
+    code = (
+        "import sys, morb_fetch; "
+        "print(sorted({'polars', 'scipy', 'pooch', 'pydantic'} & set(sys.modules)))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    assert output.strip() == "[]"
+
+
+def test_lazy_exports():
+    assert set(morb_fetch.__all__) <= set(dir(morb_fetch))
+    for name in morb_fetch.__all__:
+        assert getattr(morb_fetch, name) is not None
+    assert morb_fetch.config.get_config is morb_fetch.get_config
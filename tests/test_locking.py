@@ -0,0 +1,80 @@
+import multiprocessing
+import threading
+
+import pytest
+
+from morb_fetch.examples import Database, Example
+from morb_fetch.locking import FileLock, is_locked, lock_path
+
+PROCESSES = 8
+
+
+def retrieve_all(config, start):
+    """ Load the index and every example, as a worker sharing the cache would. """
+    start.wait()
+    database = Database(config)
+    shapes = {}
+    for id in database.list_ids():
+        example = Example(id, database)
+        example.retrieve(converted=True)
+        shapes[id] = example["A"].shape
+    return shapes
+
+
+def test_file_lock(tmp_path):
+    path = tmp_path / "file.mat"
+    assert lock_path(path.with_name("file.mat.part.0")) == tmp_path / "file.mat.lock"
+    assert lock_path(path.with_name("file.mat.part")) == tmp_path / "file.mat.lock"
+    assert lock_path(tmp_path / "a.particle.mat") == tmp_path / "a.particle.mat.lock"
+
+    with FileLock(lock_path(path)) as lock:
+        assert lock.locked and is_locked(path)
+        assert not FileLock(lock.path).acquire(blocking=False)
+        with pytest.raises(TimeoutError):
+            FileLock(lock.path, timeout=0.1).acquire()
+    assert not is_locked(path)
+
+
+def test_file_lock_threads(tmp_path):
+    counter = []
+
+    def increment():
+        for _ in range(50):
+            with FileLock(tmp_path / "counter.lock"):
+                value = len(counter)
+                counter.append(value)
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter == list(range(200))
+
+
+def test_concurrent_processes(morb_server):
+    """ Processes sharing a cache download every file exactly once and all read complete files. """
+    morb_server.delay = 0.2
+    context = multiprocessing.get_context("spawn")
+    start = context.Manager().Event()
+    with context.Pool(PROCESSES) as pool:
+        results = [
+            pool.apply_async(retrieve_all, (morb_server.config, start))
+            for _ in range(PROCESSES)
+        ]
+        start.set()
+        shapes = [result.get(timeout=120) for result in results]
+
+    assert all(shape == shapes[0] for shape in shapes)
+    assert shapes[0] == {
+        "synthetic_n10m1q1": (10, 10),
+        "synthetic_n20m1q1": (20, 20),
+        "synthetic_n40m1q1": (40, 40),
+    }
+    assert sorted(morb_server.requests) == sorted(
+        ["/examples.csv"] + [f"/synthetic/{id}.mat" for id in shapes[0]]
+    )
+
+    database = Database(morb_server.config)
+    assert len(list(database.converted.root.glob("*/meta.json"))) == 3
+    assert not list(database.cache_dir.rglob("*.part*"))
@@ -0,0 +1,93 @@
+import os
+import json
+
+import pooch
+import pytest
+
+from morb_fetch.cache import CacheManager
+from morb_fetch.examples import Database, Example
+from morb_fetch.examples.manifest import Manifest
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    """ The files hashed by `pooch.hashes.hash_matches`. """
+    files = []
+    hash_matches = pooch.hashes.hash_matches
+
+    def counting(fname, *args, **kwargs):
+        files.append(os.path.basename(fname))
+        return hash_matches(fname, *args, **kwargs)
+
+    monkeypatch.setattr(pooch.hashes, "hash_matches", counting)
+    return files
+
+
+def test_skip_rehash(morb_server, hashed):
+    db = Database(morb_server.config)
+    example = Example(db.list_ids()[0], db)
+    example.retrieve()
+    hashed.clear()
+
+    Database(morb_server.config)
+    example.retrieve()
+    assert hashed == []
+
+    example.retrieve(verify="full")
+    assert len(hashed) == 1
+
+    Database(morb_server.config, verify="full")
+    assert hashed[-1] == "examples.csv"
+
+
+def test_modified_file(morb_server):
+    db = Database(morb_server.config)
+    example = Example(db.list_ids()[0], db)
+    filepath = example.fetch(progressbar=False)
+    content = filepath.read_bytes()
+    requests = len(morb_server.requests)
+
+    # same size, other content: the modification time changes
+    filepath.write_bytes(content[:-1] + bytes([content[-1] ^ 1]))
+
+    assert example.fetch(progressbar=False) == filepath
+    assert filepath.read_bytes() == content
+    assert len(morb_server.requests) == requests + 1
+
+
+def test_discard_pruned(morb_server):
+    db = Database(morb_server.config)
+    example = Example(db.list_ids()[0], db)
+    example.fetch(progressbar=False)
+    blob = db.store.path(example["sourceFilehash"])
+    assert db.manifest.verified(blob, example["sourceFilehash"])
+
+    db.data = db.data.filter(db.data["id"] != example["id"])
+    CacheManager(db).prune()
+    assert "objects/" + blob.name not in db.manifest._read()
+
+
+def test_append_log(tmp_path):
+    files = []
+    for i in range(3):
+        files.append(tmp_path / f"{i}.bin")
+        files[-1].write_bytes(bytes(i))
+
+    manifest = Manifest(tmp_path / "manifest.json")
+    other = Manifest(tmp_path / "manifest.json")
+    for file in files:
+        manifest.record(file, "sha256:" + file.stem)
+    manifest.discard(files[:1])
+
+    # records are appended to the log, the manifest file is not rewritten
+    assert not manifest.path.exists()
+    assert len(manifest.log.read_text().splitlines()) == 4
+    assert set(other._read()) == {"1.bin", "2.bin"}
+
+    # a new manifest merges the log into the manifest file
+    assert Manifest(manifest.path)._read() == other._read()
+    assert not manifest.log.exists()
+    assert set(json.loads(manifest.path.read_text())) == {"1.bin", "2.bin"}
+
+    manifest.record(files[0], "sha256:0")
+    assert set(other._read()) == {"0.bin", "1.bin", "2.bin"}
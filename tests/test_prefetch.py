@@ -0,0 +1,45 @@
+import polars as pl
+
+from morb_fetch.config import Settings
+from morb_fetch.examples import Database, Example
+
+
+def test_prefetch(morb_server):
+    db = Database(morb_server.config)
+    ids = db.list_ids()
+
+    summary = db.prefetch(ids, max_workers=3, progressbar=False)
+    assert summary.ok
+    assert set(summary.fetched) == set(ids)
+    assert all(path.exists() for path in summary.fetched.values())
+
+    # cached files are not downloaded again
+    n_requests = len(morb_server.requests)
+    summary = db.prefetch(ids, progressbar=False)
+    assert set(summary.fetched) == set(ids)
+    assert len(morb_server.requests) == n_requests
+
+    example = Example(ids[0], db)
+    example.retrieve()
+    assert example["A"].shape == (10, 10)
+
+
+def test_prefetch_max_filesize(morb_server):
+    config = Settings(**{**morb_server.config.model_dump(), "max_filesize": "1 B"})
+    db = Database(config)
+
+    summary = db.prefetch(progressbar=False)
+    assert not summary.fetched
+    assert set(summary.skipped) == set(db.list_ids())
+
+
+def test_prefetch_failure(morb_server):
+    db = Database(morb_server.config)
+    meta = db.lookup(db.list_ids()[0])
+    db.data = db.data.with_columns(
+        sourceFilehash=pl.lit("sha256:" + 64 * "0")
+    )
+
+    summary = db.prefetch([meta["id"]], retries=0, progressbar=False)
+    assert not summary.ok
+    assert meta["id"] in summary.failed
@@ -0,0 +1,55 @@
+import asyncio
+
+from morb_fetch import RetrieveStats, add_stats_hook, remove_stats_hook
+from morb_fetch.examples import Database, Example
+
+
+def test_retrieve_stats(morb_server):
+    db = Database(morb_server.config)
+    example = Example(db.list_ids()[-1], db)
+    received = []
+    add_stats_hook(received.append)
+    try:
+        example.retrieve(converted=True)
+        cold = example.stats
+        example.retrieve(converted=True)
+        warm = example.stats
+    finally:
+        remove_stats_hook(received.append)
+
+    assert received == [cold, warm]
+    assert isinstance(cold, RetrieveStats) and cold.id == example["id"]
+
+    assert cold.source == "mat"
+    size = db.store.path(example["sourceFilehash"]).stat().st_size
+    assert cold.download_bytes == size and cold.download_rate > 0
+    assert cold.hash_seconds > 0 and cold.parse_seconds > 0 and cold.validate_seconds > 0
+    assert cold.convert_seconds > 0 and cold.load_seconds == 0
+    assert cold.peak_nbytes >= cold.nbytes > 0
+    assert cold.total_seconds >= cold.download_seconds + cold.parse_seconds
+
+    assert warm.source == "converted"
+    assert warm.download_bytes == 0 and warm.parse_seconds == 0 and warm.load_seconds > 0
+    assert warm.nbytes == cold.nbytes
+
+
+def test_stats_hook_errors(morb_server):
+    db = Database(morb_server.config)
+    example = Example(db.list_ids()[0], db)
+
+    def failing(stats):
+        raise RuntimeError("metrics system down")
+
+    add_stats_hook(failing)
+    try:
+        example.retrieve(lazy=True)
+    finally:
+        remove_stats_hook(failing)
+    assert example.stats.source == "lazy" and example.stats.nbytes == 0
+
+
+def test_aretrieve_stats(morb_server):
+    db = Database(morb_server.config)
+    example = Example(db.list_ids()[0], db)
+    asyncio.run(example.aretrieve())
+    assert example.stats.download_bytes > 0 and example.stats.validate_seconds > 0
@@ -0,0 +1,100 @@
+import os
+
+import polars as pl
+import pooch
+
+from morb_fetch.examples import Database, Example
+
+
+def write_index(morb_server, rows, name):
+    """ Publish another index revision on the server and return the settings using it. """
+    indexfile = morb_server.config.cache.parent / "server" / name
+    pl.DataFrame(rows).write_csv(indexfile)
+    return morb_server.config.model_copy(
+        update={"indexfile": name, "indexfilehash": "sha256:" + pooch.file_hash(str(indexfile))}
+    )
+
+
+def test_shared_content(morb_server):
+    db = Database(morb_server.config)
+    rows = db.data.to_dicts()
+    copy = dict(rows[0], id="copy_n10m1q1", category="copies")
+    config = write_index(morb_server, rows + [copy], "examples2.csv")
+
+    db = Database(config)
+    first = Example(rows[0]["id"], db).fetch(progressbar=False)
+    second = Example("copy_n10m1q1", db).fetch(progressbar=False)
+    assert os.path.samefile(first, second)
+    assert second == db.cache_dir / "copies" / "copy_n10m1q1.mat"
+    assert morb_server.requests.count(f"/synthetic/{rows[0]['id']}.mat") == 1
+    assert len([path for path in db.store.root.iterdir() if path.suffix != ".lock"]) == 1
+
+
+def test_index_revision(morb_server):
+    db = Database(morb_server.config)
+    ids = db.list_ids()
+    db.prefetch(progressbar=False)
+    morb_server.requests.clear()
+
+    # new revision: the content of one example changed
+    changed = morb_server.config.cache.parent / "server" / "synthetic" / f"{ids[2]}.mat"
+    changed.write_bytes(changed.read_bytes() + b"\0" * 8)
+    rows = db.data.to_dicts()
+    rows[2]["sourceFilehash"] = "sha256:" + pooch.file_hash(str(changed))
+    db = Database(write_index(morb_server, rows, "examples2.csv"))
+
+    summary = db.prefetch(progressbar=False)
+    assert summary.ok
+    assert morb_server.requests == ["/examples2.csv", f"/synthetic/{ids[2]}.mat"]
+    assert summary.fetched[ids[2]].read_bytes() == changed.read_bytes()
+
+
+def test_adopt_cached_file(morb_server):
+    db = Database(morb_server.config)
+    example = Example(db.list_ids()[0], db)
+    source = morb_server.config.cache.parent / "server" / "synthetic" / f"{example['id']}.mat"
+
+    # a data file cached before the content store
+    filepath = db.cache_dir / "synthetic" / f"{example['id']}.mat"
+    filepath.parent.mkdir()
+    filepath.write_bytes(source.read_bytes())
+
+    assert example.fetch(progressbar=False) == filepath
+    assert example["sourceFilehash"] in db.store
+    assert os.path.samefile(filepath, db.store.path(example["sourceFilehash"]))
+    assert morb_server.requests == ["/examples.csv"]
+
+
+def test_refresh(morb_server):
+    db = Database(morb_server.config)
+    ids = db.list_ids()
+    paths = db.prefetch(progressbar=False).fetched
+    for id in ids:
+        Example(id, db).retrieve(converted=True)
+    old_hashes = [Example(id, db)["sourceFilehash"] for id in ids]
+
+    # new revision: ids[0] removed, ids[1] changed, one example added
+    changed = morb_server.config.cache.parent / "server" / "synthetic" / f"{ids[1]}.mat"
+    changed.write_bytes(changed.read_bytes() + b"\0" * 8)
+    rows = db.data.to_dicts()
+    rows[1]["sourceFilehash"] = "sha256:" + pooch.file_hash(str(changed))
+    added = dict(rows[2], id="copy_n40m1q1")
+    config = write_index(morb_server, rows[1:] + [added], "examples.csv")
+
+    diff = db.refresh(config)
+    assert diff.added == ["copy_n40m1q1"]
+    assert diff.removed == [ids[0]]
+    assert diff.changed == [ids[1]]
+    assert not diff.empty
+    assert ids[0] not in db and "copy_n40m1q1" in db
+
+    # only the entries of removed and changed examples are invalidated
+    assert not paths[ids[0]].exists() and not paths[ids[1]].exists()
+    assert old_hashes[0] not in db.store and old_hashes[0] not in db.converted
+    assert old_hashes[1] not in db.store and old_hashes[1] not in db.converted
+    assert paths[ids[2]].exists() and old_hashes[2] in db.converted
+
+    morb_server.requests.clear()
+    db.prefetch(progressbar=False)
+    assert morb_server.requests == [f"/synthetic/{ids[1]}.mat"]
+    assert db.refresh(config).empty
@@ -0,0 +1,150 @@
+import os
+import json
+import asyncio
+import zipfile
+from pathlib import Path
+
+import pooch
+import pytest
+
+from morb_fetch.toolkits import MMESSDownloader
+
+
+class LocalRepository:
+    """ Stands in for the Zenodo record of a toolkit version, served by the local test server. """
+
+    def __init__(self, server, filename):
+        self.url = str(server.config.serverurl) + filename
+        self.filepath = server.config.cache.parent / "server" / filename
+
+    def populate_registry(self, registry):
+        registry.registry[self.filepath.name] = "md5:" + pooch.file_hash(
+            str(self.filepath), alg="md5"
+        )
+
+    def download_url(self, filename):
+        return self.url
+
+
+@pytest.fixture
+def toolkit_server(morb_server, tmp_path, monkeypatch):
+    """ The local test server with MMESS 3.0 and 3.1 release archives. """
+    repositories = {}
+    for version in ("3.0", "3.1"):
+        filename = f"MMESS-{version}.zip"
+        with zipfile.ZipFile(morb_server.config.cache.parent / "server" / filename, "w") as archive:
+            archive.writestr(f"MMESS-{version}/README.md", f"M-M.E.S.S. {version}")
+            archive.writestr(f"MMESS-{version}/mess_lradi.m", "function out = mess_lradi()")
+        doi = MMESSDownloader.registry[version].replace("doi:", "")
+        repositories[doi] = LocalRepository(morb_server, filename)
+
+    morb_server.metadata = []
+
+    def doi_to_repository(doi):
+        morb_server.metadata.append(doi)
+        return repositories[doi]
+
+    monkeypatch.setattr(pooch.downloaders, "doi_to_repository", doi_to_repository)
+    monkeypatch.setattr(
+        "morb_fetch.config._config",
+        morb_server.config.model_copy(
+            update={"mmess_path": tmp_path / "MMESS", "morlab_path": tmp_path / "MORLAB"}
+        ),
+    )
+    return morb_server
+
+
+def test_retrieve_version(toolkit_server, monkeypatch):
+    def read_back(*args, **kwargs):
+        raise AssertionError("archive hashed after download")
+
+    monkeypatch.setattr(pooch.hashes, "hash_matches", read_back)
+    path = MMESSDownloader.retrieve_version("3.1")
+
+    assert path == str(MMESSDownloader.download_path / "MMESS-3.1")
+    assert (MMESSDownloader.download_path / "MMESS-3.1" / "README.md").read_text() == "M-M.E.S.S. 3.1"
+    assert toolkit_server.requests == ["/MMESS-3.1.zip"]
+
+    MMESSDownloader.retrieve_version("3.1")
+    assert toolkit_server.requests == ["/MMESS-3.1.zip"]
+
+
+def test_registry_cached(toolkit_server, monkeypatch):
+    MMESSDownloader.retrieve_version("3.1")
+    assert len(toolkit_server.metadata) == 1
+
+    # a new process reads the registry from disk
+    monkeypatch.setattr("morb_fetch.toolkits.toolkit._registries", {})
+    MMESSDownloader.retrieve_version("3.1")
+    assert len(toolkit_server.metadata) == 1
+
+
+def test_skip_extraction(toolkit_server, monkeypatch):
+    MMESSDownloader.retrieve_version("3.1")
+
+    def extractall(*args, **kwargs):
+        raise AssertionError("verified tree extracted again")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(zipfile.ZipFile, "extractall", extractall)
+        MMESSDownloader.retrieve_version("3.1")
+
+        # a tree unpacked before is verified against the archive instead of extracted
+        MMESSDownloader._marker("3.1").unlink()
+        MMESSDownloader.retrieve_version("3.1")
+        assert MMESSDownloader._marker("3.1").exists()
+
+        # a modified file of the same size is found by its CRC-32
+        readme = MMESSDownloader.download_path / "MMESS-3.1" / "README.md"
+        mtime_ns = readme.stat().st_mtime_ns
+        readme.write_text(readme.read_text().lower())
+        os.utime(readme, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+        with pytest.raises(AssertionError, match="extracted again"):
+            MMESSDownloader.retrieve_version("3.1")
+
+    MMESSDownloader.retrieve_version("3.1")
+    assert readme.read_text() == "M-M.E.S.S. 3.1"
+
+    # an incomplete tree is unpacked again
+    readme.unlink()
+    MMESSDownloader.retrieve_version("3.1")
+    assert readme.exists()
+
+
+def test_retrieve_versions(toolkit_server):
+    paths = MMESSDownloader.retrieve_versions(["3.0", "3.1"])
+    assert paths == {
+        version: str(MMESSDownloader.download_path / f"MMESS-{version}") for version in ("3.0", "3.1")
+    }
+    assert sorted(toolkit_server.requests) == ["/MMESS-3.0.zip", "/MMESS-3.1.zip"]
+
+    paths = asyncio.run(MMESSDownloader.aretrieve_versions(["3.0", "3.1"]))
+    assert (MMESSDownloader.download_path / "MMESS-3.0" / "README.md").read_text() == "M-M.E.S.S. 3.0"
+    assert len(toolkit_server.requests) == 2
+
+
+def test_retrieve_unknown_version():
+    with pytest.raises(ValueError, match="not found"):
+        MMESSDownloader.retrieve_version("0.0")
+
+
+def test_snapshot(toolkit_server, tmp_path, monkeypatch):
+    from morb_fetch.toolkits import MORLABDownloader, refresh_snapshot
+
+    monkeypatch.setattr(MMESSDownloader, "registry", {"3.1": MMESSDownloader.registry["3.1"]})
+    monkeypatch.setattr(MORLABDownloader, "registry", {})
+    assert refresh_snapshot() == [MMESSDownloader._snapshot_path(), MORLABDownloader._snapshot_path()]
+    assert len(toolkit_server.metadata) == 1
+
+    # resolution is a lookup in the snapshot, only the archive is downloaded
+    path = MMESSDownloader.retrieve_version("3.1")
+    assert (Path(path) / "README.md").exists()
+    assert len(toolkit_server.metadata) == 1
+    assert toolkit_server.requests == ["/MMESS-3.1.zip"]
+    assert [file.name for file in MMESSDownloader._snapshot_path().parent.iterdir()] == ["snapshot.json"]
+
+    # or written to another file
+    assert refresh_snapshot(tmp_path / "registry.json") == [tmp_path / "registry.json"]
+    assert json.loads((tmp_path / "registry.json").read_text()) == json.loads(
+        MMESSDownloader._snapshot_path().read_text()
+    )